@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Benchmarks of mock5
+
+Author: lumiknit (aasr4r4@gmail.com)
+
+Example:
+  ./bench.py                 # run all benchmarks
+  ./bench.py encode          # run a benchmark
+  ./bench.py encode 15 15    # in 15x15 board
+"""
+
+import random
+import time
+
+from mock5 import Mock5, encode_batch
+
+#-- Helpers
+
+def random_games(n, height=15, width=15, seed=0):
+  """ Make n games of random positions
+  """
+  rng = random.Random(seed)
+  games = []
+  for _ in range(n):
+    g = Mock5(height, width)
+    for _ in range(rng.randrange(height * width // 2)):
+      g.push(g.random_legal_move(rng))
+    games.append(g)
+  return games
+
+def measure(fn, repeat=5):
+  """ Best seconds of repeated fn() calls
+  """
+  best = float('inf')
+  for _ in range(repeat):
+    t = time.perf_counter()
+    fn()
+    best = min(best, time.perf_counter() - t)
+  return best
+
+#-- Benchmarks
+
+def bench_encode(height=15, width=15, batch=256):
+  """ encode_batch vs stacking numpy() of each game
+  """
+  import numpy as np
+  games = random_games(batch, height, width)
+  out = np.empty((batch, 3, height, width))
+  assert (encode_batch(games, out=out) ==
+          np.stack([g.numpy() for g in games])).all()
+  t_stack = measure(lambda: np.stack([g.numpy() for g in games]))
+  t_batch = measure(lambda: encode_batch(games, out=out))
+  print("encode {} boards of {}x{}".format(batch, height, width))
+  print("  stack numpy(): {:8.3f} ms".format(t_stack * 1e3))
+  print("  encode_batch:  {:8.3f} ms ({:.1f}x)"
+        .format(t_batch * 1e3, t_stack / t_batch))
+
+benchmarks = {
+  "encode": bench_encode,
+}
+
+#-- Entrypoint
+
+if __name__ == "__main__":
+  import sys
+  names = [a for a in sys.argv[1:] if a in benchmarks] or list(benchmarks)
+  size = [int(a) for a in sys.argv[1:] if a.isdigit()]
+  for name in names:
+    benchmarks[name](*size[:2])
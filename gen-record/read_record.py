@@ -5,40 +5,75 @@ Author: lumiknit (aasr4r4@gmail.com)
 
 Record (generated by gen.cpp) reader for torch
 """
+import numpy as np
 import torch
 
-def read_record_from_file(h, w, filename):
+def parse_record_text(text):
+  """Parse the whole text record into flat move arrays
+
+  Each game is a header line '<WINNER> <NUM_MOVES>' followed by NUM_MOVES
+  lines of board indices. The first move of a game is labelled with color
+  WINNER, and colors alternate after that.
+
+  Returns:
+    idx (np.ndarray(int64)[<NUM_SAMPLE>]): board index of each move
+    color (np.ndarray(int64)[<NUM_SAMPLE>]): color (1|2) of each move
+    start (np.ndarray(int64)[<NUM_SAMPLE>]):
+      sample index of the first move of the game each move belongs to
+  """
+  tokens = np.fromstring(text, dtype=np.int64, sep=' ')
+  # Only headers need a python loop; moves are sliced out in bulk
+  heads = []
+  p = 0
+  while p + 1 < len(tokens):
+    heads.append(p)
+    p += 2 + int(tokens[p + 1])
+  if p != len(tokens):
+    raise ValueError("Record is truncated or corrupted")
+  heads = np.array(heads, dtype=np.int64)
+  winners = tokens[heads]
+  lengths = tokens[heads + 1]
+  n = int(lengths.sum())
+  # Game number and ply of each move
+  game = np.repeat(np.arange(len(heads)), lengths)
+  first = np.cumsum(lengths) - lengths
+  ply = np.arange(n) - first[game]
+  idx = tokens[heads[game] + 2 + ply]
+  color = np.where(ply % 2 == 0, winners[game], 3 - winners[game])
+  return idx, color, first[game]
+
+def read_record_from_file(h, w, filename, debug=False):
   """Record (generated by gen.cpp) reader for torch
 
+  Args:
+    h (int): Height of board
+    w (int): Width of board
+    filename (str): Record file name
+    debug (bool): Print every reconstructed sample if it's True
+
   Returns:
     X (torch.tensor(<NUM_SAMPLE>, 3, h, w)): one-hot-encoding version tensor
     Y (torch.tensor(<NUM_SAMPLE>, 1)): label. 1 = good, -1 = bad
   """
-  X = []
-  Y = []
   with open(filename) as file:
-    left = 0
-    v = 0
-    for line in file:
-      if left <= 0:
-        z = [torch.ones(h, w, dtype=torch.float),
-             torch.zeros(h, w, dtype=torch.float),
-             torch.zeros(h, w, dtype=torch.float)]
-        bd = torch.stack(z)
-        v, left = map(int, line.split())
-      else:
-        print(bd)
-        idx = int(line)
-        y = idx // w
-        x = idx % w
-        bd[0][y][x] = 0
-        bd[v][y][x] = 1
-        X.append(bd.clone())
-        Y.append(torch.tensor([3 - v * 2], dtype=torch.float))
-        v = 3 - v
-        left -= 1
-  Xs = torch.stack(X)
-  Ys = torch.stack(Y)
+    idx, color, start = parse_record_text(file.read())
+  n = len(idx)
+  # Scatter each move into its own row, then accumulate rows of a game
+  # (uint8 may wrap around, but the difference below is still exact)
+  planes = np.zeros((2, n, h * w), dtype=np.uint8)
+  planes[color - 1, np.arange(n), idx] = 1
+  np.cumsum(planes, axis=1, dtype=np.uint8, out=planes)
+  # Remove stones accumulated from the previous games
+  has_prev = start > 0
+  planes[:, has_prev] -= planes[:, start[has_prev] - 1]
+  X = np.empty((n, 3, h * w), dtype=np.float32)
+  X[:, 1] = planes[0]
+  X[:, 2] = planes[1]
+  X[:, 0] = 1 - X[:, 1] - X[:, 2]
+  Xs = torch.from_numpy(X).view(n, 3, h, w)
+  Ys = torch.from_numpy((3 - color * 2).astype(np.float32)).view(n, 1)
+  if debug:
+    for x in Xs: print(x)
   return Xs, Ys
 
 if __name__ == "__main__":
@@ -18,9 +18,17 @@ Example:
   # or read `example_of_Mock5` (at the bottom of mock5.py).
 """
 
-__all__ = ['Mock5']
+__all__ = ['Mock5', 'simulate', 'SimulationResult', 'encode_batch']
 __version__ = '0.0.1'
 
+import sys
+from array import array
+from collections import namedtuple, OrderedDict
+from functools import lru_cache
+
+from mock5.symmetry import forward_table, gather_table, symmetry_shape, \
+    symmetries
+
 #-- Constants
 
 # Stone color
@@ -31,6 +39,9 @@ WHITE = 2
 # Stone color to displayed character
 _STONE_CHAR = ['.', 'O', 'X']
 
+# Stone color (as a byte) to base-3 digit
+_STONE_DIGIT = bytes.maketrans(b'\x00\x01\x02', b'012')
+
 #-- Helpers
 
 def _digit_to_int(s, offset=0):
@@ -59,6 +70,43 @@ def _int_to_digit(v):
   elif 10 <= v and v < 10 + 26: return chr(65 + v - 10)
   else: return None
 
+@lru_cache(maxsize=None)
+def _line_starts(height, width, dir):
+  """
+  (start, step, length) in a flat board of each line in dir
+  """
+  res = []
+  if dir == 0:
+    for r in range(height): res.append((r * width, 1, width))
+  elif dir == 1:
+    for c in range(width): res.append((c, width, height))
+  elif dir == 2:
+    for i in range(height + width - 1):
+      r, c = max(0, height - 1 - i), max(0, i - height + 1)
+      res.append((r * width + c, width + 1, min(height - r, width - c)))
+  elif dir == 3:
+    for i in range(height + width - 1):
+      r, c = max(0, i - width + 1), min(i, width - 1)
+      res.append((r * width + c, width - 1, min(height - r, c + 1)))
+  else:
+    raise ValueError("dir should be 0, 1, 2 or 3")
+  return tuple(res)
+
+@lru_cache(maxsize=None)
+def _line_table(height, width, dir):
+  """
+  Read-only numpy.array(int64)[n_lines][max_len] of flat indices of lines
+  in dir. Cells after the end of a line are height * width.
+  """
+  import numpy as np
+  starts = _line_starts(height, width, dir)
+  n = max(l for _, _, l in starts)
+  t = np.full((len(starts), n), height * width, dtype=np.int64)
+  for i, (s, d, l) in enumerate(starts):
+    t[i, :l] = np.arange(l) * d + s
+  t.flags.writeable = False
+  return t
+
 #-- Game class
 
 class Mock5:
@@ -69,14 +117,21 @@ class Mock5:
   * Pretty print (__str__)
   * Provide indexing by row-column (__getitem__, __setitem__)
   * Duplicate and rotate/flip a board (duplicate, replay, rotate_ccw, etc.)
+  * Symmetric boards by permutation tables (transform, transforms_numpy)
+  * Canonical form among symmetric boards (canonical, canonical_key)
   * Make an iterater of indices (iter_row/column/right_down/left_down)
   * Get first (row,col) of iterator (first_of_row/column/right_down/left_down)
   * Extract a line of board (slice_row/column/right_down/left_down)
+  * Zero-copy numpy views of board and lines (board_array, line_view, lines)
   * "Action" i.e. placing a stone (can_place_at, place_stone)
   * History for backtrack (undo)
-  * Simple analysis to check game is finished (check_win)
+  * Unchecked fast path for search and rollouts (push, pop)
+  * Simple analysis to check game is finished (check_win, check_win_at)
+  * Legal moves in O(1) (legal_moves, num_legal, random_legal_move)
   * Generate empty-or-not array (empty_array, empty_numpy, empty_tensor)
   * And, convert board into numpy.array and torch.tensor (numpy, tensor)
+  * Cache conversions until the position changes
+  * Compact serialization for pickle and IPC (to_bytes, from_bytes)
 
   Note that each cells of `board` contains 0 (empty), 1 (black) or 2 (white).
   Also, each of 1 and 2 stand for player 1 and player 2.
@@ -93,8 +148,27 @@ class Mock5:
       In default settings, 1P=black player must place the first stone.
       Thus, you can consider that odd index = black stone and even = white.
     player (1 | 2): Index of player who should place stone now
+    _empty (int[]), _empty_pos (int[]):
+      Dense list of empty cell indices, and the position of each cell in it.
+      They are updated by every method placing or removing stones,
+      so do not modify `board` directly.
+    debug (bool):
+      Class attribute. If it's True, unchecked methods (push, pop)
+      validate their arguments by assertions. Default is False.
+    _version (int), _cache ((int, OrderedDict)?):
+      Move counter, bumped by every method changing the position,
+      and encodings (numpy, tensor, ...) cached for a version.
+    cache_size (int):
+      Class attribute. Maximum number of cached encodings. Default is 16.
   """
 
+  __slots__ = ('height', 'width', 'board', 'history', 'player',
+               '_empty', '_empty_pos', '_version', '_cache')
+
+  debug = False
+
+  cache_size = 16
+
   # Constructor
   def __init__(self, height=15, width=15, board=None, history=None):
     """ Constructor
@@ -125,6 +199,9 @@ class Mock5:
       self.board = list(board)
     else:
       self.board = [0] * (self.height * self.width)
+    self._reset_empty()
+    self._version = 0
+    self._cache = None
     # Turn informations
     self.player = 1
     self.history = []
@@ -221,7 +298,87 @@ class Mock5:
     self._check_key(key)
     if (type(value) is not int) or value < 0 or value > 2:
       raise TypeError
-    self.board[self._reduce_index(key[0], key[1])] = value
+    idx = self._reduce_index(key[0], key[1])
+    old = self.board[idx]
+    self.board[idx] = value
+    self._version += 1
+    if old == 0 and value != 0: self._take_empty(idx)
+    elif old != 0 and value == 0: self._give_empty(idx)
+
+  # Empty cell index
+
+  def _reset_empty(self):
+    """
+    Rebuild the dense list of empty cells from board
+    """
+    self._empty = [i for i, v in enumerate(self.board) if v == 0]
+    self._empty_pos = [0] * len(self.board)
+    for p, i in enumerate(self._empty): self._empty_pos[i] = p
+
+  def _take_empty(self, idx):
+    """
+    Remove idx from empty cells by swapping with the last one.
+    _empty_pos[idx] keeps its old position for _give_empty.
+    """
+    e, pos = self._empty, self._empty_pos
+    p = pos[idx]
+    last = e.pop()
+    if last != idx:
+      e[p] = last
+      pos[last] = p
+
+  def _give_empty(self, idx):
+    """
+    Add idx to empty cells. If it's the last taken one, the list is
+    restored exactly as before _take_empty.
+    """
+    e, pos = self._empty, self._empty_pos
+    p = pos[idx]
+    if p < len(e):
+      moved = e[p]
+      pos[moved] = len(e)
+      e.append(moved)
+      e[p] = idx
+    else:
+      pos[idx] = len(e)
+      e.append(idx)
+
+  def legal_moves(self):
+    """ Legal Moves
+
+    Returns:
+      int[]: Indices (row * width + col) of empty cells, in no order
+    """
+    return list(self._empty)
+
+  def num_legal(self):
+    """ Number of Legal Moves
+
+    Returns:
+      int: Number of empty cells
+    """
+    return len(self._empty)
+
+  def random_legal_move(self, rng=None):
+    """ Random Legal Move
+
+    Pick an empty cell uniformly in O(1).
+
+    Args:
+      rng (random.Random | numpy.random.Generator?):
+        Anything with `random()` returning a float in [0, 1).
+        Default is the `random` module.
+
+    Returns:
+      int | None: Index (row * width + col) of an empty cell,
+        None if there is no empty cell
+    """
+    n = len(self._empty)
+    if n == 0: return None
+    if rng is None:
+      import random
+      rng = random
+    return self._empty[int(rng.random() * n)]
 
   # Duplicate
 
@@ -233,6 +390,59 @@ class Mock5:
     """
     return self.__class__(self.height, self.width, board=self.board)
 
+  @classmethod
+  def from_board(cls, board, height=None, width=None):
+    """ Make a game from a board position
+
+    The real order of moves is unknown, so history is rebuilt by
+    interleaving black and white stones, each in index order.
+
+    Args:
+      board (int[height * width] | int[height][width]): Board filled with
+        0, 1, 2. A list, or a numpy.array of rank 1 or 2.
+      height (int?): Height of board. Default is taken from a rank 2 board.
+      width (int?): Width of board. Default is taken from a rank 2 board.
+
+    Returns:
+      Mock5: The game. player is white iff black has one more stone.
+
+    Raises:
+      ValueError: Numbers of stones cannot be of a game
+    """
+    if height is None or width is None:
+      height, width = len(board), len(board[0])
+    flat = []
+    for x in board:
+      if hasattr(x, '__len__'): flat.extend(int(v) for v in x)
+      else: flat.append(int(x))
+    if len(flat) != height * width: raise ValueError("Wrong board size")
+    black = [i for i, x in enumerate(flat) if x == 1]
+    white = [i for i, x in enumerate(flat) if x == 2]
+    if len(black) - len(white) not in (0, 1):
+      raise ValueError("Numbers of black and white stones are not of a game")
+    history = [0] * (len(black) + len(white))
+    history[0::2] = black
+    history[1::2] = white
+    return cls._from_state(height, width, flat, history,
+                           2 if len(black) > len(white) else 1)
+
+  @classmethod
+  def _from_state(cls, height, width, board, history, player):
+    """
+    Make a game from its state without any validation.
+    board and history are not copied.
+    """
+    g = cls.__new__(cls)
+    g.height = height
+    g.width = width
+    g.board = board
+    g.history = history
+    g.player = player
+    g._reset_empty()
+    g._version = 0
+    g._cache = None
+    return g
+
   def replay(self, angle=0, flip=0):
     """ Duplicate Board by History
 
@@ -243,23 +453,14 @@ class Mock5:
       angle (int): Rotation angle. 0, 1, 2 or 3
       flip (int): Flip. 1 is flip, 0 is not.
     """
-    if angle == 0 and flip == 0:
-      return self.__class__(self.height, self.width, history=self.history)
-    l = len(self.history)
-    h = [0] * l
-    for i in range(l):
-      r, c = self.history[i] // self.width, self.history[i] % self.width
-      mw = self.width - 1
-      mh = self.height - 1
-      if flip % 2 == 1: c = mw - c
-      if angle % 4 == 0: h[i] = r * self.width + c
-      if angle % 4 == 1: h[i] = (mw - c) * self.height + r
-      elif angle % 4 == 2: h[i] = (mh - r) * self.width + (mw - c)
-      elif angle % 4 == 3: h[i] = c * self.height + (mh - r)
-    if angle % 2 == 1:
-      return self.__class__(self.width, self.height, history=h)
-    else:
-      return self.__class__(self.height, self.width, history=h)
+    k = (flip % 2) * 4 + angle % 4
+    h, w = symmetry_shape(self.height, self.width, k)
+    f = forward_table(self.height, self.width, k)
+    history = [f[i] for i in self.history]
+    board = [0] * (h * w)
+    for i in range(0, len(history), 2): board[history[i]] = 1
+    for i in range(1, len(history), 2): board[history[i]] = 2
+    return self._from_state(h, w, board, history, 1 + len(history) % 2)
 
   # History-based Duplicate Method with D4-Group Operations
   
@@ -268,24 +469,112 @@ class Mock5:
     
     Create a new board, which is rotated 90 deg CCW of original board.
     """
-    def rotate_idx(idx):
-      r, c = self._expand_index(idx)
-      c = self.width - c - 1
-      return c * self.height + r
-    new_history = list(map(rotate_idx, self.history))
-    return self.__class__(self.width, self.height, history=new_history)
+    return self.replay(1, 0)
 
   def flip_vertical(self):
     """ Flip Board Vertically
     
     Create a new board, which is flipped up and down of original board.
     """
-    def flip_idx(idx):
-      r, c = self._expand_index(idx)
-      r = self.height - r - 1
-      return r * self.width + c
-    new_history = list(map(flip_idx, self.history))
-    return self.__class__(self.height, self.width, history=new_history)
+    return self.replay(2, 1)
+
+  # Board-based D4-Group Operations
+
+  def transform(self, k):
+    """ Symmetric Board
+
+    Create a new board, which is the k-th symmetry of this board.
+    Unlike `replay`, it moves the board itself (including stones which are
+    not in history) and keeps the current player.
+
+    Args:
+      k (int): Symmetry index, flip * 4 + angle (0~7). See `replay`.
+        Odd k exchanges height and width.
+    """
+    h, w = symmetry_shape(self.height, self.width, k)
+    g = gather_table(self.height, self.width, k)
+    f = forward_table(self.height, self.width, k)
+    b = self.board
+    return self._from_state(
+        h, w, [b[i] for i in g], [f[i] for i in self.history], self.player)
+
+  def transforms(self):
+    """ All Symmetric Boards
+
+    Returns:
+      list(Mock5): `[self.transform(k) for k in range(8)]`
+    """
+    return [self.transform(k) for k in range(8)]
+
+  def transforms_numpy(self, player=None, one_hot_encoding=True, dtype=None):
+    """ numpy.array Batch of Symmetric Boards
+
+    Stack every symmetric board with the same shape as this board.
+    See `.numpy()` for the arguments.
+
+    Returns:
+      numpy.array(dtype=dtype):
+        one_hot_encoding => [n][3][height][width]
+        !one_hot_encoding => [n][height][width]
+        where n is 8 for square board and 4 (k = 0, 2, 4, 6) otherwise.
+    """
+    from mock5.symmetry import gather_array
+    g = gather_array(self.height, self.width)
+    n = self.numpy(player=player, one_hot_encoding=one_hot_encoding,
+                   rank=2 if one_hot_encoding else 1, dtype=dtype)
+    if one_hot_encoding:
+      return n[:, g].transpose(1, 0, 2).reshape(
+          len(g), 3, self.height, self.width)
+    else:
+      if dtype is not None: n = n.astype(dtype)
+      return n[g].reshape(len(g), self.height, self.width)
+
+  # Canonical Form
+
+  def _symmetric_digits(self, k):
+    """
+    Base-3 digit string of the k-th symmetric board
+    """
+    g = gather_table(self.height, self.width, k)
+    return bytes(map(self.board.__getitem__, g)).translate(_STONE_DIGIT)
+
+  def _canonical_digits(self):
+    """
+    (digits, k) of the lexicographically minimal symmetric board
+    """
+    best, best_k = None, None
+    for k in symmetries(self.height, self.width):
+      d = self._symmetric_digits(k)
+      if best is None or d < best: best, best_k = d, k
+    return best, best_k
+
+  def canonical(self):
+    """ Canonical Form of Board
+
+    Find the representative of boards equivalent under rotations and flips:
+    the lexicographically minimal board among `transform(k)`.
+    For non-square boards, only k = 0, 2, 4, 6 (which keep the shape) are
+    considered.
+
+    Returns:
+      Mock5: The canonical board, i.e. `self.transform(k)`
+      int: k, the symmetry index mapping this board to the canonical one.
+        If several k give the same board, the smallest one.
+    """
+    _, k = self._canonical_digits()
+    return self.transform(k), k
+
+  def canonical_key(self):
+    """ Hashable Key of Canonical Form
+
+    Two boards have the same key iff they have the same size and one is
+    a rotation/flip of the other (see `canonical`).
+
+    Returns:
+      int: (canonical board as base-3 number) << 12 | height << 6 | width
+    """
+    d, _ = self._canonical_digits()
+    return (int(d, 3) << 12) | (self.height << 6) | self.width
 
   #-- Index Iterator
 
@@ -388,33 +677,92 @@ class Mock5:
 
   #-- Slice
 
+  def _slice(self, dir, idx):
+    """
+    Slice of board list for idx-th line in dir
+    """
+    starts = _line_starts(self.height, self.width, dir)
+    if idx < 0 or idx >= len(starts): raise IndexError
+    s, d, l = starts[idx]
+    if l == 1: return [self.board[s]]
+    return self.board[s : s + (l - 1) * d + 1 : d]
+
   def slice_row(self, idx):
     """ Extrat row
     
     Make a idx-th row slice of board
     """
-    return [self[r, c] for r, c in self.iter_row(idx)]
+    return self._slice(0, idx)
 
   def slice_column(self, idx):
     """ Extrat column
     
     Make a idx-th column slice of board
     """
-    return [self[r, c] for r, c in self.iter_column(idx)]
+    return self._slice(1, idx)
 
   def slice_right_down(self, idx):
     """ Extrat right down diagonal
     
     Make a idx-th slice of board in right down direciton
     """
-    return [self[r, c] for r, c in self.iter_right_down(idx)]
+    return self._slice(2, idx)
   
   def slice_left_down(self, idx):
     """ Extrat left down diagonal
     
     Make a idx-th slice of board in left down direciton
     """
-    return [self[r, c] for r, c in self.iter_left_down(idx)]
+    return self._slice(3, idx)
+
+  def board_array(self):
+    """ Board as a numpy.array
+
+    It's cached until the position changes, so do not keep it after that.
+
+    Returns:
+      numpy.array(uint8)[height][width]: Read-only board
+    """
+    import numpy as np
+    return self._cached(('board_array',), lambda: np.frombuffer(
+        bytes(self.board), dtype=np.uint8).reshape(self.height, self.width))
+
+  def line_view(self, dir, idx):
+    """ Line of board as a numpy.array view
+
+    It's the same as slice_* without copy (see `board_array`).
+
+    Args:
+      dir (int): 0 (row), 1 (column), 2 (right down) or 3 (left down)
+      idx (int): Index of line, as slice_*
+
+    Returns:
+      numpy.array(uint8)[length]: Read-only view of `board_array()`
+    """
+    starts = _line_starts(self.height, self.width, dir)
+    if idx < 0 or idx >= len(starts): raise IndexError
+    s, d, l = starts[idx]
+    flat = self.board_array().reshape(-1)
+    return flat[s : s + (l - 1) * d + 1 : d] if l > 1 else flat[s : s + 1]
+
+  def lines(self, dir, pad=3):
+    """ All lines in dir as one padded numpy.array
+
+    For vectorised pattern scanning over lines.
+
+    Args:
+      dir (int): 0 (row), 1 (column), 2 (right down) or 3 (left down)
+      pad (int): Value after the end of each line, e.g. 3 as a wall
+
+    Returns:
+      numpy.array(uint8)[n_lines][max_len]: res[i][:len] == slice_*(i)
+    """
+    import numpy as np
+    t = _line_table(self.height, self.width, dir)
+    ext = np.empty(self.height * self.width + 1, dtype=np.uint8)
+    ext[:-1] = self.board_array().reshape(-1)
+    ext[-1] = pad
+    return ext[t]
 
   # Placing stone methods
 
@@ -482,6 +830,57 @@ class Mock5:
     r, c = self._expand_index(idx)
     return self.place_stone(r, c, player)
 
+  # Unchecked placing methods
+
+  def push(self, idx):
+    """ Place a Stone without Validation
+
+    Place the current player's stone at idx = (row * width + col),
+    and pass the turn to opponent.
+    Unlike `place_stone_at_index`, it checks nothing: the caller must
+    guarantee that idx is in range and the cell is empty.
+    It's for search agents and rollouts, which make millions of moves.
+    Set `Mock5.debug = True` to turn on assertions.
+
+    Args:
+      idx (int): Value of (row * width + col)
+    """
+    if self.debug:
+      assert 0 <= idx < len(self.board), "Index out of range"
+      assert self.board[idx] == 0, "Cell is not empty"
+    self.board[idx] = self.player
+    self.history.append(idx)
+    self.player = 3 - self.player
+    self._version += 1
+    # Inlined _take_empty
+    e, pos = self._empty, self._empty_pos
+    p = pos[idx]
+    last = e.pop()
+    if last != idx:
+      e[p] = last
+      pos[last] = p
+
+  def pop(self):
+    """ Undo without Validation
+
+    Take the last move back, which was placed by `push` or `place_stone`.
+    Unlike `undo`, history must not be empty and the board is not checked.
+    Set `Mock5.debug = True` to turn on assertions.
+
+    Returns:
+      int: Index of the removed stone
+    """
+    if self.debug:
+      assert len(self.history) > 0, "No history"
+      assert self.board[self.history[-1]] == 3 - self.player, \
+          "Board is corrupted!"
+    idx = self.history.pop()
+    self.board[idx] = 0
+    self.player = 3 - self.player
+    self._version += 1
+    self._give_empty(idx)
+    return idx
+
   # History
 
   def history_depth(self):
@@ -506,7 +905,9 @@ class Mock5:
       if self.board[idx] != 3 - self.player:
         raise Exception("Board is corrupted!")
       self.board[idx] = 0
+      self._give_empty(idx)
       self.player = 3 - self.player
+      self._version += 1
     return len(self.history)
 
   def make_history_int_pair_array(self, winner=0):
@@ -523,6 +924,75 @@ class Mock5:
       a.append(0)
     return a
 
+  # Serialization
+
+  def to_bytes(self):
+    """ Serialize into compact bytes
+
+    Usually a game is written by its history:
+      [0, height, width, player] + history (uint16 LE each)
+    If board is not made by history alone (e.g. changed by `__setitem__`),
+    it's written with a 2-bit packed board:
+      [1, height, width, player] + board (4 cells per byte, LSB first)
+        + history (uint16 LE each)
+    It's also used by pickle, which makes games cheap to send to other
+    processes.
+
+    Returns:
+      bytes: Serialized game
+    """
+    b, hist, n = self.board, self.history, len(self.history)
+    by_history = n == len(b) - len(self._empty)
+    if by_history:
+      # The last stone is the opponent's, and colors alternate backward
+      c = 3 - self.player
+      for i in range(n - 1, -1, -1):
+        if b[hist[i]] != c:
+          by_history = False
+          break
+        c = 3 - c
+    h = array('H', hist)
+    if sys.byteorder == 'big': h.byteswap()
+    head = bytes((0 if by_history else 1, self.height, self.width,
+                  self.player))
+    if by_history: return head + h.tobytes()
+    packed = bytearray((len(b) + 3) // 4)
+    for i, v in enumerate(b):
+      if v: packed[i >> 2] |= v << ((i & 3) << 1)
+    return head + bytes(packed) + h.tobytes()
+
+  @classmethod
+  def from_bytes(cls, data):
+    """ Deserialize bytes made by `to_bytes`
+
+    Returns:
+      Mock5: The game
+    """
+    kind, height, width, player = data[0], data[1], data[2], data[3]
+    sz = height * width
+    off = 4
+    if kind == 0:
+      board = [0] * sz
+    elif kind == 1:
+      packed = data[off : off + (sz + 3) // 4]
+      board = [(packed[i >> 2] >> ((i & 3) << 1)) & 3 for i in range(sz)]
+      off += len(packed)
+    else:
+      raise ValueError("Unknown serialized game")
+    history = array('H')
+    history.frombytes(data[off:])
+    if sys.byteorder == 'big': history.byteswap()
+    history = history.tolist()
+    if kind == 0:
+      c = 3 - player
+      for i in range(len(history) - 1, -1, -1):
+        board[history[i]] = c
+        c = 3 - c
+    return cls._from_state(height, width, board, history, player)
+
+  def __reduce__(self):
+    return (self.__class__.from_bytes, (self.to_bytes(),))
+
   # Check game finished
 
   def _scan_with_iter(self, iter):
@@ -574,17 +1044,47 @@ class Mock5:
       if v is not None:
         return v
     # Check draw
-    if len(self.history) >= self.width * self.height:
+    if len(self._empty) == 0:
       # Draw
       return 0
     # Not finished
     return None
 
+  def check_win_at(self, idx):
+    """ Check the Stone at idx Makes 5 in a Row
+
+    Scan only 4 lines through idx, so it's much cheaper than `check_win`.
+    Use it right after each move to find the game is finished.
+
+    Args:
+      idx (int): Value of (row * width + col)
+
+    Returns:
+      None | int: Color of the stone at idx if it makes 5 (or more) stones
+        in a row, otherwise None
+    """
+    b, h, w = self.board, self.height, self.width
+    p = b[idx]
+    if p == 0: return None
+    r, c = idx // w, idx % w
+    for dr, dc in ((0, 1), (1, 0), (1, 1), (1, -1)):
+      cnt = 1
+      rr, cc = r + dr, c + dc
+      while 0 <= rr < h and 0 <= cc < w and b[rr * w + cc] == p:
+        cnt += 1
+        rr, cc = rr + dr, cc + dc
+      rr, cc = r - dr, c - dc
+      while 0 <= rr < h and 0 <= cc < w and b[rr * w + cc] == p:
+        cnt += 1
+        rr, cc = rr - dr, cc - dc
+      if cnt >= 5: return p
+    return None
+
   # Play game
 
   def play(self, input1=None, input2=None, random_first=True, \
       print_intermediate_state=True, \
-      print_messages=True):
+      print_messages=True, time_control=None, ponder=False):
     """ Run a Game with Two Players
 
     Take two players and process game.
@@ -608,6 +1108,15 @@ class Mock5:
         Print every intermediate state f it's True
       print_messages (Bool):
         Print messages if it's True
+      time_control (mock5.clock.TimeControl?):
+        If it's given, each move is timed by its clocks, and a player
+        running out of time forfeits or plays a default move, following
+        its policy. Agents with `timed = True` attribute are called as
+        `agent(game, deadline=...)`. Time used is recorded in it.
+      ponder (Bool):
+        If True and one of inputs is the user, the agent ponders
+        (thinks about likely replies in background) during user's turn.
+        See `mock5.ponder`.
 
     Returns:
       int: 1 if input1 win, 2 if input2 win, 0 if they draw
@@ -636,6 +1145,11 @@ class Mock5:
     if random_first and random.random() < 0.5:
       exchanged = True
       input1, input2 = input2, input1
+    ponderer = None
+    if ponder and (input1 is None) != (input2 is None):
+      from mock5.ponder import Ponderer
+      if input1 is None: ponderer = input2 = Ponderer(input2)
+      else: ponderer = input1 = Ponderer(input1)
     if input1 is None: input1 = user_input
     if input2 is None: input2 = user_input
     pif = [None, input1, input2]
@@ -644,10 +1158,24 @@ class Mock5:
         return "{}p ({})".format(idx, pif[idx].name)
       else: return "{}p ({})".format(idx, pif[idx])
     winner = None
+    if time_control is not None: time_control.reset()
     while True:
       if print_intermediate_state:
         print(str(self))
-      ret = pif[self.player](self)
+      if ponderer is not None and pif[self.player] is user_input:
+        ponderer.start(self)
+      if time_control is None:
+        ret = pif[self.player](self)
+      else:
+        # Clocks are indexed by input1/input2, not by color
+        ret, timeout = time_control.call(pif[self.player], self,
+            3 - self.player if exchanged else self.player)
+        if timeout:
+          if print_messages:
+            print("{} runs out of time!".format(player_name(self.player)))
+          if time_control.on_timeout == 'forfeit':
+            winner = 3 - self.player
+            break
       if ret is None: r, c = False, 0
       else: r, c = ret
       if (r is None) or (r is False):
@@ -673,6 +1201,7 @@ class Mock5:
           if winner == 0: print("Draw!")
           else: print("{} win!".format(player_name(winner)))
         break
+    if ponderer is not None: ponderer.close()
     if (winner is not None) and winner > 0 and exchanged:
       winner = 3 - winner
     return winner
@@ -692,7 +1221,26 @@ class Mock5:
     if player == None: player = self.player
     return [0, player, 3 - player]
 
-  def board_for(self, player=None):
+  def _cached(self, key, make):
+    """
+    Encoding of the current position for key, made by make() on a miss.
+    Cached ones are dropped when the position changes (see _version),
+    or the least recently used one when there are more than cache_size.
+    """
+    c = self._cache
+    if c is None or c[0] != self._version:
+      c = self._cache = (self._version, OrderedDict())
+    d = c[1]
+    v = d.get(key)
+    if v is None:
+      v = make()
+      d[key] = v
+      if len(d) > self.cache_size: d.popitem(last=False)
+    else:
+      d.move_to_end(key)
+    return v
+
+  def board_for(self, player=None, copy=True):
     """
     Make a copy of board, which contains given player's stones as 1
     and opponent's stones as 2
@@ -701,12 +1249,15 @@ class Mock5:
       player (int?):
         1 or 2 to specify player.
         Default value is current player.
+      copy (bool):
+        If it's False, return the cached list itself. Do not modify it.
 
     Returns:
       int[height * width]: Copy of board
     """
     m = self._map_for_player(player)
-    return [m[x] for x in self.board]
+    a = self._cached(('board_for', m[1]), lambda: [m[x] for x in self.board])
+    return list(a) if copy else a
 
   def one_hot_encoding(self, player=None):
     """
@@ -729,7 +1280,8 @@ class Mock5:
       a[m[self.board[i]]][i] = 1
     return a
 
-  def numpy(self, player=None, one_hot_encoding=True, rank=None, dtype=None):
+  def numpy(self, player=None, one_hot_encoding=True, rank=None, dtype=None,
+      copy=True):
     """ numpy.array Conversion
 
     Convert self into numpy.array.
@@ -747,6 +1299,8 @@ class Mock5:
       dtype (numpy.dtype):
         Element type of result array.
         Default value is numpy.float
+      copy (bool):
+        If it's False, return the cached array itself, which is read-only.
 
     Returns:
       numpy.array(dtype=dtype): There are 5 variations of rank/dim
@@ -757,24 +1311,29 @@ class Mock5:
         !one_hot_encoding & rank=1 => [height * width]    (default)
     """
     import numpy as np
-    if dtype is None: dtype = np.float
-    if one_hot_encoding:
-      a = self.one_hot_encoding(player=player)
-      n = np.array(a, dtype=dtype)
-      if rank == 1:
-        n = n.reshape(-1)
-      elif rank == 2: pass
+    if dtype is None: dtype = np.float64
+    if player is None: player = self.player
+    def make():
+      if one_hot_encoding:
+        a = self.one_hot_encoding(player=player)
+        n = np.array(a, dtype=dtype)
+        if rank == 1:
+          n = n.reshape(-1)
+        elif rank == 2: pass
+        else:
+          n = n.reshape(3, self.height, self.width)
       else:
-        n = n.reshape(3, self.height, self.width)
-      return n
-    else:
-      a = self.board_for(player=player)
-      n = np.array(a)
-      if rank == 2:
-        n = n.reshape(self.width, self.height)
+        a = self.board_for(player=player, copy=False)
+        n = np.array(a)
+        if rank == 2:
+          n = n.reshape(self.width, self.height)
+      n.flags.writeable = False
       return n
+    n = self._cached(('numpy', player, one_hot_encoding, rank, dtype), make)
+    return n.copy() if copy else n
 
-  def tensor(self, player=None, one_hot_encoding=True, rank=None, dtype=None):
+  def tensor(self, player=None, one_hot_encoding=True, rank=None, dtype=None,
+      copy=True):
     """ torch.tensor conversion
 
     Convert self into torch.tensor.
@@ -795,6 +1354,8 @@ class Mock5:
       dtype (torch.dtype):
         Element type of result tensor.
         Default value is torch.float
+      copy (bool):
+        If it's False, return the cached tensor itself. Do not modify it.
 
     Returns:
       torch.tensor(dtype=dtype): There are 5 variations of rank/dim
@@ -806,46 +1367,75 @@ class Mock5:
     """
     import torch
     if dtype is None: dtype = torch.float
-    if one_hot_encoding:
-      a = self.one_hot_encoding(player=player)
-      n = torch.tensor(a, dtype=dtype)
-      if rank == 1:
-        n = n.view(-1)
-      elif rank == 2: pass
+    if player is None: player = self.player
+    def make():
+      if one_hot_encoding:
+        a = self.one_hot_encoding(player=player)
+        n = torch.tensor(a, dtype=dtype)
+        if rank == 1:
+          n = n.view(-1)
+        elif rank == 2: pass
+        else:
+          n = n.view(3, self.height, self.width)
       else:
-        n = n.view(3, self.height, self.width)
-      return n
-    else:
-      a = self.board_for(player=player)
-      n = torch.tensor(a)
-      if rank == 2:
-        n = n.view(self.width, self.height)
+        a = self.board_for(player=player, copy=False)
+        n = torch.tensor(a)
+        if rank == 2:
+          n = n.view(self.width, self.height)
       return n
+    n = self._cached(('tensor', player, one_hot_encoding, rank, dtype), make)
+    return n.clone() if copy else n
 
   def tensors_with_a_stone(
-      self, player=None, one_hot_encoding=True, rank=None, dtype=None):
+      self, player=None, one_hot_encoding=True, rank=None, dtype=None,
+      out=None, indices=None):
     """ torch.tensor conversion with placing a stone to each place
 
     Convert self into an array of torch.tensor.
+    The current player's stone is placed on each candidate cell.
+    All tensors are made from one encoding of the board at once.
     See `.tensor()` for more information about arguments and returns
 
+    Args:
+      out (torch.tensor?): Contiguous buffer with at least as many rows as
+        candidates. If it's given, results are written into out[:n] and
+        dtype is ignored.
+      indices (int[]?): Candidate indices. Default is all cells.
+        Non-empty cells are skipped.
+
     Returns:
       list(int): indices where stone is placed. (Not (row, col), but index)
-      torch.tensor: See `.tensor()`
+      torch.tensor: [n] + shape of `.tensor()`. It's a view of out if given.
     """
     import torch
     if player is None: player = self.player
-    Xs = []
-    idxs = []
-    for i in range(self.height * self.width):
-      if self.place_stone_at_index(i):
-        idxs.append(i)
-        Xs.append(self.tensor(
-          player=player, one_hot_encoding=one_hot_encoding,
-          rank=rank, dtype=dtype
-        ))
-        self.undo()
-    X = torch.stack(Xs)
+    sz = self.height * self.width
+    if indices is None: indices = range(sz)
+    idxs = [i for i in indices if self.board[i] == 0]
+    n = len(idxs)
+    m = self._map_for_player(player)
+    stone = m[self.player]
+    bd = torch.frombuffer(bytearray(self.board), dtype=torch.uint8)
+    rows = torch.arange(n)
+    cols = torch.tensor(idxs, dtype=torch.int64)
+    if one_hot_encoding:
+      if dtype is None: dtype = torch.float
+      if out is not None: X = out[:n].view(n, 3, sz)
+      else: X = torch.empty((n, 3, sz), dtype=dtype)
+      base = torch.stack([bd == 0, bd == player, bd == 3 - player])
+      X.copy_(base.unsqueeze(0).expand(n, 3, sz))
+      X[rows, 0, cols] = 0
+      X[rows, stone, cols] = 1
+      if rank == 1: X = X.view(n, -1)
+      elif rank == 2: pass
+      else: X = X.view(n, 3, self.height, self.width)
+    else:
+      if out is not None: X = out[:n].view(n, sz)
+      else: X = torch.empty((n, sz), dtype=torch.int64)
+      base = torch.tensor(m, dtype=torch.int64)[bd.long()]
+      X.copy_(base.unsqueeze(0).expand(n, sz))
+      X[rows, cols] = stone
+      if rank == 2: X = X.view(n, self.width, self.height)
     return idxs, X
 
   # Empty-or-not array
@@ -864,10 +1454,12 @@ class Mock5:
       type(empty)[height * width]:
         [idx] equals to empty iff board[idx] == 0 (empty)
     """
-    m = [empty, non_empty, non_empty]
-    return [m[self.board[idx]] for idx in range(self.height * self.width)]
+    a = [non_empty] * (self.height * self.width)
+    for idx in self._empty: a[idx] = empty
+    return a
 
-  def empty_numpy(self, rank=1, empty=1., non_empty=0., dtype=None):
+  def empty_numpy(self, rank=1, empty=1., non_empty=0., dtype=None,
+      copy=True):
     """ Numpy array of empty
 
     Make a numpy array,
@@ -881,6 +1473,8 @@ class Mock5:
       dtype (numpy.dtype?):
         dtype of numpy.array.
         In default, it follows the type of empty
+      copy (bool):
+        If it's False, return the cached array itself, which is read-only.
 
     Returns:
       numpy.array(dtype=dtype): There are 2 variations of rank
@@ -889,14 +1483,18 @@ class Mock5:
     """
     import numpy as np
     if dtype is None: dtype = type(empty)
-    em = self.empty_array(empty, non_empty)
-    arr = np.array(em, dtype=dtype)
-    if rank == 2:
-      return arr.reshape(self.height, self.width)
-    else:
+    def make():
+      arr = np.full(self.height * self.width, non_empty, dtype=dtype)
+      arr[self._empty] = empty
+      if rank == 2: arr = arr.reshape(self.height, self.width)
+      arr.flags.writeable = False
       return arr
+    arr = self._cached(('empty_numpy', rank == 2, empty, non_empty, dtype),
+                       make)
+    return arr.copy() if copy else arr
 
-  def empty_tensor(self, rank=1, empty=True, non_empty=False, dtype=None):
+  def empty_tensor(self, rank=1, empty=True, non_empty=False, dtype=None,
+      copy=True):
     """ Torch tensor of empty
 
     Make a torch tensor,
@@ -913,6 +1511,8 @@ class Mock5:
       dtype (torch.dtype?):
         dtype of torch.tensor
         In default, it follows the type of empty
+      copy (bool):
+        If it's False, return the cached tensor itself. Do not modify it.
 
     Returns:
       torch.tensor(dtype=dtype): There are 2 variations of rank
@@ -921,11 +1521,14 @@ class Mock5:
     """
     import torch
     if dtype is None: dtype = type(empty)
-    em = self.empty_array(empty, non_empty)
-    tensor = torch.tensor(em, dtype=dtype)
-    if rank == 2:
-      return tensor.view(self.height, self.width)
-    return tensor
+    def make():
+      em = self.empty_array(empty, non_empty)
+      tensor = torch.tensor(em, dtype=dtype)
+      if rank == 2: tensor = tensor.view(self.height, self.width)
+      return tensor
+    tensor = self._cached(
+        ('empty_tensor', rank == 2, empty, non_empty, dtype), make)
+    return tensor.clone() if copy else tensor
 
   # Plot
   def plot(self):
@@ -964,6 +1567,168 @@ class Mock5:
           x, y, lbl, zorder=3.0,
           ha='center', va='center', fontdict=fnt)
 
+#-- Simulation
+
+SimulationResult = namedtuple(
+    'SimulationResult', ['winner', 'history', 'latency', 'exchanged'])
+SimulationResult.__doc__ = """ Result of a simulated game
+
+  Attributes:
+    winner (int): 1 if agent1 wins, 2 if agent2 wins, 0 if they draw
+    history (array('H')): Indices (row * width + col) of moves.
+      Black (player 1) placed the first one.
+    latency (array('d')): Seconds spent by the agent for each move
+    exchanged (bool): True iff agent1 played with white stones
+"""
+
+def simulate(agent1, agent2, n_games=1, height=15, width=15, rng=None,
+    random_first=True):
+  """ Run Games between Two Agents without I/O
+
+  A lean version of `Mock5.play` for bulk evaluation and data generation.
+  Moves are placed by `push` and finished games are found by
+  `check_win_at`, and one board is reused for all games.
+
+  If an agent returns None, (False, _) or an illegal move,
+  it loses the game (there is no undo).
+
+  Args:
+    agent1, agent2 ((Mock5) => (int, int)): Agents. See `Mock5.play`.
+    n_games (int): Number of games
+    height (int): Height of board
+    width (int): Width of board
+    rng (random.Random | numpy.random.Generator?):
+      Anything with `random()`, used to choose stone colors.
+      Default is the `random` module.
+    random_first (bool):
+      If False, agent1 always plays with black stones.
+      Otherwise, stone colors are randomly chosen for each game.
+
+  Returns:
+    list(SimulationResult): Result of each game
+  """
+  from time import perf_counter
+  if rng is None:
+    import random
+    rng = random
+  game = Mock5(height, width)
+  board = game.board
+  results = []
+  for _ in range(n_games):
+    exchanged = bool(random_first and rng.random() < 0.5)
+    if exchanged: agents = (None, agent2, agent1)
+    else: agents = (None, agent1, agent2)
+    latency = array('d')
+    winner = None
+    while winner is None:
+      t = perf_counter()
+      ret = agents[game.player](game)
+      latency.append(perf_counter() - t)
+      if ret is None or ret[0] is None or ret[0] is False:
+        winner = 3 - game.player
+        break
+      r, c = int(ret[0]), int(ret[1])
+      idx = r * width + c
+      if r < 0 or r >= height or c < 0 or c >= width or board[idx] != 0:
+        winner = 3 - game.player
+        break
+      game.push(idx)
+      if game.check_win_at(idx) is not None: winner = board[idx]
+      elif game.num_legal() == 0: winner = 0
+    if exchanged and winner > 0: winner = 3 - winner
+    results.append(SimulationResult(
+        winner, array('H', game.history), latency, exchanged))
+    while len(game.history) > 0: game.pop()
+  return results
+
+#-- Batch encoding
+
+def encode_batch(games, out=None, player=None, one_hot_encoding=True,
+    rank=None, dtype=None, last_move=False, side_to_move=False):
+  """ Encode many games into one numpy.array
+
+  A batched `Mock5.numpy()`. Each row of the result is the same as
+  `numpy()` of the game, and it's written straight into out without
+  intermediate arrays. Reuse out for every batch to avoid allocations.
+
+  Args:
+    games (Mock5[]): Games of the same size
+    out (numpy.array?): C-contiguous buffer with at least len(games) rows
+      and the row shape of the result. Results are written into out[:N],
+      and dtype is ignored.
+    player (int?): 1 or 2 for all games. Default is each game's player.
+    one_hot_encoding (bool): See `Mock5.numpy()`
+    rank (int): Rank of each row. See `Mock5.numpy()`.
+    dtype (numpy.dtype): Element type. Default is numpy.float64 for one hot
+      encoding, otherwise numpy.int64 (same as `numpy()`).
+    last_move (bool): Add a plane marked by 1 at the last move
+    side_to_move (bool): Add a plane filled with 1 iff black is to move
+
+  Returns:
+    numpy.array(dtype=dtype): Shape is [N] + shape of `numpy()` row.
+      Extra planes follow the 3 planes of one hot encoding, so
+      C = 3 + last_move + side_to_move:
+        one_hot_encoding & rank=3 => [N][C][height][width]   (default)
+        one_hot_encoding & rank=2 => [N][C][height * width]
+        one_hot_encoding & rank=1 => [N][C * height * width]
+        !one_hot_encoding & rank=2 => [N][width][height]
+        !one_hot_encoding & rank=1 => [N][height * width]    (default)
+
+  Raises:
+    ValueError: Boards of different sizes, extra planes without one hot
+      encoding, or wrong out
+  """
+  import numpy as np
+  n = len(games)
+  if n == 0: raise ValueError("No games to encode")
+  h, w = games[0].height, games[0].width
+  sz = h * w
+  if any(g.height != h or g.width != w for g in games):
+    raise ValueError("All boards should be of the same size")
+  n_planes = 3 + bool(last_move) + bool(side_to_move)
+  if not one_hot_encoding and n_planes > 3:
+    raise ValueError("Extra planes need one hot encoding")
+  if one_hot_encoding:
+    if rank == 1: shape = (n_planes * sz,)
+    elif rank == 2: shape = (n_planes, sz)
+    else: shape = (n_planes, h, w)
+  else:
+    shape = (w, h) if rank == 2 else (sz,)
+  if out is None:
+    if dtype is None: dtype = np.float64 if one_hot_encoding else np.int64
+    out = np.empty((n,) + shape, dtype=dtype)
+  elif out.shape[1:] != shape or len(out) < n or \
+      not out.flags.c_contiguous:
+    raise ValueError("out should be C-contiguous of shape [>={}]+{}"
+                     .format(n, list(shape)))
+  res = out[:n]
+  bd = np.frombuffer(b"".join(bytes(g.board) for g in games),
+                     dtype=np.uint8).reshape(n, sz)
+  if player is None: pl = np.array([g.player for g in games], np.uint8)
+  else: pl = np.full(n, player, dtype=np.uint8)
+  pl = pl[:, None]
+  if not one_hot_encoding:
+    o = res.reshape(n, sz)
+    o[:] = bd
+    o[(bd != 0) & (bd != pl)] = 2
+    o[bd == pl] = 1
+    return res
+  o = res.reshape(n, n_planes, sz)
+  o[:, 0] = bd == 0
+  o[:, 1] = bd == pl
+  o[:, 2] = (bd != 0) & (bd != pl)
+  c = 3
+  if last_move:
+    o[:, c] = 0
+    played = [(i, g.history[-1]) for i, g in enumerate(games) if g.history]
+    if played:
+      rows, idxs = zip(*played)
+      o[list(rows), c, list(idxs)] = 1
+    c += 1
+  if side_to_move:
+    o[:, c] = np.array([g.player == 1 for g in games])[:, None]
+  return res
+
 #-- Example
 
 def example_of_Mock5():
@@ -12,9 +12,10 @@ Use `agent` function.
 
 from mock5.analysis import *
 
-def score_at(game, a, i):
+def score_at(game, a, i, rng=None):
   import math
   import random
+  if rng is None: rng = random
   score = 1
   r, c = game._expand_index(i)
   if game[r, c] != 0: return 0
@@ -24,32 +25,75 @@ def score_at(game, a, i):
   # Center is preffered
   score += math.sqrt(hh * hh + hw * hw) - math.sqrt((dr * dr) + (dc * dc))
   # Make some noise for random choice
-  score += random.random()
+  score += rng.random()
   for dir in range(4):
     m = a.get_critical_at(game.player, dir, i)
     o = a.get_critical_at(3 - game.player, dir, i)
     score += (10 ** m) + (10 ** o) * 0.7
   return score
 
-def policy(game):
+def policy(game, rng=None):
   import numpy as np
-  a = Analysis(game)
+  a = workspace(game)
   scores = np.zeros(game.height * game.width)
   for i in range(game.height * game.width):
-    scores[i] = score_at(game, a, i)
+    scores[i] = score_at(game, a, i, rng)
   return scores
 policy.name = "greedy"
 
-def agent(game):
-  a = Analysis(game)
+def _fill_policy(game, out, rng=None):
+  """
+  Vectorised `policy` into out, drawing the same random numbers
+  """
+  import math
+  import random
+  import numpy as np
+  if rng is None: rng = random
+  a = workspace(game)
+  hh = (game.height - 1) / 2
+  hw = (game.width - 1) / 2
+  dr = np.arange(game.height)[:, None] - hh
+  dc = np.arange(game.width)[None, :] - hw
+  center = math.sqrt(hh * hh + hw * hw) - np.sqrt(dr * dr + dc * dc)
+  s = 1 + center.reshape(-1)
+  empty = np.array(game.board) == 0
+  s[empty] += [rng.random() for _ in range(int(empty.sum()))]
+  pw = np.array([10.0 ** k for k in range(N_OVER_5 + 1)])
+  m = a.critical_levels(game.player)
+  o = a.critical_levels(3 - game.player)
+  for dir in range(4):
+    s += pw[m[dir]] + pw[o[dir]] * 0.7
+  out[empty] = s[empty]
+
+def policy_batch(games_or_boards, height=None, width=None, processes=None,
+    rng=None):
+  """ `policy` of many games
+
+  Args:
+    games_or_boards: Games or boards (see `mock5.analysis.games_of`)
+    height (int?): Height of flat boards
+    width (int?): Width of flat boards
+    processes (int?): Number of worker processes. Default is 1.
+    rng (random.Random?): Random source of noise (see
+      `mock5.analysis.run_policy_batch`)
+
+  Returns:
+    numpy.array[N][height * width]: Scores of each game
+  """
+  return run_policy_batch(_fill_policy, games_or_boards, height, width,
+                          processes, rng=rng)
+
+def agent(game, rng=None):
+  a = workspace(game)
 
   max_s = -float('inf')
   max_i = None
 
   for i in range(game.height * game.width):
-    score = score_at(game, a, i)
+    score = score_at(game, a, i, rng)
     if score > max_s: max_s, max_i = score, i
   if max_i is None: return None
   return game._expand_index(max_i)
 
 agent.name = "agent-analysis-based"
+agent.seeded = True
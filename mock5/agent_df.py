@@ -38,9 +38,12 @@ def score_at(game, a, i):
   else:
     return 0
 
-def policy(game):
+def policy(game, book=None):
   sz = game.height * game.width
-  a = Analysis(game)
+  if book is not None:
+    # Opening book (mock5.opening_book.OpeningBook)
+    p = book.policy(game)
+    if p is not None: return p
   lh = len(game.history)
   if lh == 0:
     # First, place a stone near to center
@@ -65,6 +68,7 @@ def policy(game):
           if 0 <= xc and xc < game.width:
             a[xr * game.width + xc] = 1
     return a
+  a = workspace(game)
   mz = [np.zeros(sz) for i in range(7)]
   for i in range(sz):
     if game.board[i] == 0:
@@ -76,9 +80,72 @@ def policy(game):
   return mz[0]
 policy.name = "df"
 
-def agent(game):
+def _fill_policy(game, out, rng=None, book=None):
+  """
+  Vectorised `policy` into out (it has no random noise; rng is unused)
+  """
+  if book is not None:
+    p = book.policy(game)
+    if p is not None:
+      out[:] = p
+      return
+  if len(game.history) <= 2:
+    out[:] = policy(game)
+    return
+  a = workspace(game)
   sz = game.height * game.width
-  p = policy(game)
+  mine = a.critical_levels(game.player).astype(np.int64)
+  opp = a.critical_levels(3 - game.player).astype(np.int64)
+  mn = np.zeros(sz, dtype=np.int64)
+  cnt = np.ones(sz, dtype=np.int64)
+  s = np.zeros(sz)
+  for dir in range(4):
+    m, o = mine[dir], opp[dir]
+    s += m + o * 0.9
+    mv = m * 2 + (m >= N_5)
+    ov = o * 2 + (o < N_5)
+    for v in (mv, ov):
+      cnt = np.where(mn == v, cnt + 1, np.where(mn < v, 1, cnt))
+      mn = np.maximum(mn, v)
+  score = np.select(
+      [mn >= N_5 * 2,
+       (mn >= N_OPEN_4 * 2) | ((mn // 2 == N_4) & (cnt >= 2)),
+       mn >= N_OPEN_3 * 2,
+       mn > 0],
+      [5 + mn % 2, 3 + mn % 2, 1 + mn % 2, s / (8 * N_4)], 0)
+  empty = np.array(game.board) == 0
+  level = np.where(score >= 1, score.astype(np.int64), 0)
+  for i in range(6, 0, -1):
+    sel = empty & (level == i)
+    if sel.any():
+      out[sel] = 1
+      return
+  sel = empty & (level == 0)
+  out[sel] = score[sel]
+
+def policy_batch(games_or_boards, height=None, width=None, book=None,
+    processes=None):
+  """ `policy` of many games
+
+  Args:
+    games_or_boards: Games or boards (see `mock5.analysis.games_of`)
+    height (int?): Height of flat boards
+    width (int?): Width of flat boards
+    book (mock5.opening_book.OpeningBook?): Opening book
+    processes (int?): Number of worker processes. Default is 1.
+
+  Returns:
+    numpy.array[N][height * width]: Policy of each game
+  """
+  fill = _fill_policy
+  if book is not None:
+    import functools
+    fill = functools.partial(_fill_policy, book=book)
+  return run_policy_batch(fill, games_or_boards, height, width, processes)
+
+def agent(game, book=None):
+  sz = game.height * game.width
+  p = policy(game, book=book)
   m = (np.array(game.board) == 0).astype(int)
   a = p * m
   sa = a.sum()
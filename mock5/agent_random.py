@@ -12,11 +12,8 @@ Use `agent` function.
 
 def agent(game):
   import random
-  idx = random.randint(0, game.height * game.width)
-  for off in range(game.height * game.width):
-    rdx = (idx + off) % (game.height * game.width)
-    r, c = game._expand_index(rdx)
-    if game.can_place_at(r, c):
-      return (r, c)
+  idx = game.random_legal_move(random)
+  if idx is None: return None
+  return game._expand_index(idx)
 
 agent.name = "agent-random"
@@ -9,8 +9,13 @@ Analysis tool for Mock5.
 The purpose of this module is:
   * Find game is finished
   * Find out double-3, double-4, 3-4, over-5-stones-in-a-row
+
+Agents analyzing a position every move should use `workspace(game)`,
+which reuses one Analysis per thread instead of allocating a new one.
 """
 
+import threading
+
 #-- Analysis class
 
 def _sign(x):
@@ -50,15 +55,88 @@ class Analysis:
   It takes a game board Mock5 and anlayze the state:
   - (TODO) (semi-)opend 4 connections
   - (TODO) 3-3, 3-4, 4-4 after one move
+
+  Attributes:
+    game (Mock5): The analyzed game
+    sz (int): Number of cells
+    data (bytearray[2 * 4 * sz]): Bitmasks (B_*) of all colors and dirs,
+      data[((color - 1) * 4 + dir) * sz + idx]
+    result (None, memoryview[4][sz], memoryview[4][sz]):
+      result[color][dir][idx] is a bitmask, which is a view of data
   """
   def __init__(self, game):
+    self.game = None
+    self.sz = 0
+    self._shape = None
+    self.analyze(game)
+
+  def analyze(self, game):
+    """ Analyze a game again, reusing all buffers of self
+
+    Returns:
+      Analysis: self
+    """
+    if (game.height, game.width) != self._shape: self._allocate(game)
+    else: self._view[:] = self._zeros
     self.game = game
-    self.sz = game.height * game.width
-    self.result = [None,]
-    for i in range(2):
-      a = [[0] * self.sz for i in range(4)]
-      self.result.append(a)
     self.run_analysis()
+    return self
+
+  def _allocate(self, game):
+    sz = game.height * game.width
+    self.sz = sz
+    self._shape = (game.height, game.width)
+    self._zeros = bytes(8 * sz)
+    self.data = bytearray(8 * sz)
+    self._view = memoryview(self.data)
+    self.result = [None,]
+    for c in range(2):
+      self.result.append(
+          [self._view[(c * 4 + d) * sz : (c * 4 + d + 1) * sz]
+           for d in range(4)])
+    self._windows = [self._Window(self, d) for d in range(4)]
+    self._lines = _lines_of(game)
+
+  def to_bytes(self):
+    """ Serialize into compact bytes
+
+    Format: length of game bytes (uint32 LE), `Mock5.to_bytes()` of game,
+    then data. It's also used by pickle.
+
+    Returns:
+      bytes: Serialized analysis
+    """
+    g = self.game.to_bytes()
+    return len(g).to_bytes(4, 'little') + g + bytes(self.data)
+
+  @classmethod
+  def from_bytes(cls, data):
+    """ Deserialize bytes made by `to_bytes`, without analyzing again
+
+    Returns:
+      Analysis: The analysis, with its game
+    """
+    from mock5 import Mock5
+    n = int.from_bytes(data[:4], 'little')
+    game = Mock5.from_bytes(data[4 : 4 + n])
+    a = cls.__new__(cls)
+    a._allocate(game)
+    a.game = game
+    a._view[:] = data[4 + n:]
+    return a
+
+  def __reduce__(self):
+    return (self.__class__.from_bytes, (self.to_bytes(),))
+
+  def numpy(self):
+    """ Bitmasks as a numpy.array view of data (no copy)
+
+    Returns:
+      numpy.array(uint8)[2][4][sz]: [color - 1][dir][idx] is a bitmask.
+        It's overwritten by the next `analyze`.
+    """
+    import numpy as np
+    return np.frombuffer(self.data, dtype=np.uint8).reshape(2, 4, self.sz)
 
   def print_result(self, c, dir):
     r = "====================================="
@@ -93,6 +171,12 @@ class Analysis:
       self.p = 0
       self.an = an
 
+    def reset(self):
+      self.board[:] = (3, 3, 3, 3, 3, 3, 3)
+      self.idx[:] = (None, None, None, None, None, None, None)
+      self.n_color[:] = (0, 0, 0, 5)
+      self.p = 0
+
     def color_at(self, off):
       return self.board[(self.p + off) % 7]
 
@@ -104,7 +188,9 @@ class Analysis:
       self.n_color[self.color_at(5)] += 1
 
     def mark(self, c, off, bm):
-      return self.an.mark(c, self.dir, self.idx[(self.p + off) % 7], bm)
+      an = self.an
+      i = ((c - 1) * 4 + self.dir) * an.sz + self.idx[(self.p + off) % 7]
+      an.data[i] |= bm
 
     def _check_5(self, c):
       # Find empty idx
@@ -171,27 +257,13 @@ class Analysis:
       self.check_connection()
 
   def fill_result(self):
-    # Row
-    for i in range(self.game.height):
-      w = self._Window(self, 0)
-      for (r, c) in self.game.iter_row(i):
-        w.push_and_check(self.game[r, c], self.game._reduce_index(r, c))
-      w.push_and_check()
-    # Col
-    for i in range(self.game.width):
-      w = self._Window(self, 1)
-      for (r, c) in self.game.iter_column(i):
-        w.push_and_check(self.game[r, c], self.game._reduce_index(r, c))
-      w.push_and_check()
-    # Diagonal
-    for i in range(self.game.width + self.game.height - 1):
-      w = self._Window(self, 2)
-      for (r, c) in self.game.iter_right_down(i):
-        w.push_and_check(self.game[r, c], self.game._reduce_index(r, c))
-      w.push_and_check()
-      w = self._Window(self, 3)
-      for (r, c) in self.game.iter_left_down(i):
-        w.push_and_check(self.game[r, c], self.game._reduce_index(r, c))
+    # Rows, columns and diagonals
+    board = self.game.board
+    for d, line in self._lines:
+      w = self._windows[d]
+      w.reset()
+      for idx in line:
+        w.push_and_check(board[idx], idx)
       w.push_and_check()
 
   def get_critical_at(self, color, dir, idx):
@@ -205,6 +277,142 @@ class Analysis:
     elif bm & B_2: return N_2
     return 0
 
+  def critical_levels(self, color):
+    """ Levels of get_critical_at for all directions and cells at once
+
+    Returns:
+      numpy.array(uint8)[4][height * width]:
+        levels[dir][idx] == get_critical_at(color, dir, idx)
+    """
+    return level_table()[self.numpy()[color - 1]]
+
   def run_analysis(self):
     self.fill_result()
 
+#-- Workspace
+
+# (height, width) => [(dir, idx[])] of all lines
+_LINES = {}
+
+def _lines_of(game):
+  """
+  Indices of each row, column and diagonal of game's board
+  """
+  key = (game.height, game.width)
+  lines = _LINES.get(key)
+  if lines is None:
+    its = [(0, game.iter_row, game.height), (1, game.iter_column, game.width),
+           (2, game.iter_right_down, game.height + game.width - 1),
+           (3, game.iter_left_down, game.height + game.width - 1)]
+    lines = []
+    for d, it, n in its:
+      for i in range(n):
+        lines.append((d, [game._reduce_index(r, c) for (r, c) in it(i)]))
+    _LINES[key] = lines
+  return lines
+
+_local = threading.local()
+
+def workspace(game):
+  """ Analysis of game in a reusable per-thread workspace
+
+  The returned Analysis is reused by the next call in the same thread,
+  so do not keep it after analyzing another game.
+
+  Returns:
+    Analysis: Analysis of game
+  """
+  a = getattr(_local, 'analysis', None)
+  if a is None:
+    a = _local.analysis = Analysis(game)
+    return a
+  return a.analyze(game)
+
+#-- Batch helpers
+
+_LEVEL_TABLE = None
+
+def level_table():
+  """ Lookup table from a result bitmask to its level
+
+  Returns:
+    numpy.array(uint8)[128]: table[bm] is the level (N_*) of bitmask bm
+  """
+  global _LEVEL_TABLE
+  if _LEVEL_TABLE is None:
+    import numpy as np
+    t = np.zeros(B_OVER_5 * 2, dtype=np.uint8)
+    levels = ((B_2, N_2), (B_3, N_3), (B_OPEN_3, N_OPEN_3), (B_4, N_4),
+              (B_OPEN_4, N_OPEN_4), (B_5, N_5), (B_OVER_5, N_OVER_5))
+    for bm in range(len(t)):
+      for b, n in levels:
+        if bm & b: t[bm] = n
+    _LEVEL_TABLE = t
+  return _LEVEL_TABLE
+
+def games_of(games_or_boards, height=None, width=None):
+  """ Make games from games or boards
+
+  Args:
+    games_or_boards (Mock5[] | numpy.array[N][height][width] |
+        numpy.array[N][height * width]):
+      Games, or boards filled with 0, 1, 2 (see `Mock5.from_board`)
+    height (int?): Height of flat boards
+    width (int?): Width of flat boards
+
+  Returns:
+    Mock5[]: Games. Given games are not copied.
+  """
+  from mock5 import Mock5
+  return [g if isinstance(g, Mock5) else Mock5.from_board(g, height, width)
+          for g in games_or_boards]
+
+def _fill_chunk(task):
+  fill, games, seed = task
+  import random
+  import numpy as np
+  rng = random.Random(seed)
+  out = np.zeros((len(games), games[0].height * games[0].width))
+  for i, g in enumerate(games): fill(g, out[i], rng)
+  return out
+
+def run_policy_batch(fill, games_or_boards, height=None, width=None,
+    processes=None, chunk=64, rng=None):
+  """ Compute policies of many games into one array
+
+  Args:
+    fill ((Mock5, numpy.array[height * width], random.Random) => None):
+      Write the policy of a game into a zero-filled row, drawing random
+      noise from the last argument.
+      It should be a module-level function to run over processes.
+    games_or_boards: See `games_of`
+    processes (int?): Number of worker processes. Default is 1, which runs
+      everything in this process.
+    chunk (int): Games per task of a worker
+    rng (random.Random?): Random source. Default is the `random` module.
+      Over processes, each task draws from its own `random.Random`
+      seeded by rng, so a seeded rng gives the same result every time.
+
+  Returns:
+    numpy.array[N][height * width]: Policy of each game
+  """
+  import numpy as np
+  games = games_of(games_or_boards, height, width)
+  if len(games) == 0:
+    return np.zeros((0, (height or 0) * (width or 0)))
+  sz = games[0].height * games[0].width
+  if any(g.height * g.width != sz for g in games):
+    raise ValueError("All boards should be of the same size")
+  if rng is None:
+    import random
+    rng = random
+  if processes is None or processes <= 1 or len(games) <= chunk:
+    out = np.zeros((len(games), sz))
+    for i, g in enumerate(games): fill(g, out[i], rng)
+    return out
+  import multiprocessing
+  tasks = [(fill, games[i : i + chunk], rng.getrandbits(64))
+           for i in range(0, len(games), chunk)]
+  with multiprocessing.Pool(processes) as pool:
+    return np.concatenate(pool.map(_fill_chunk, tasks))
+
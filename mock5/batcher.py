@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""mock5 batcher
+
+Author: lumiknit (aasr4r4@gmail.com)
+
+Inference micro-batcher for model-backed agents.
+
+Calling a model with one `game.tensor()` per move wastes most of its
+throughput. `InferenceBatcher` runs the model in a worker thread instead.
+Games running concurrently (threads or asyncio tasks) submit positions,
+and the worker gathers them until the batch is full or the oldest request
+waited `max_latency` seconds. Then it encodes them into one preallocated
+batch tensor, runs one forward pass, and scatters the results back.
+
+Example:
+  from mock5.batcher import InferenceBatcher, batched_agent
+  with InferenceBatcher(model, 15, 15, max_batch_size=64) as b:
+    agent = batched_agent(b)
+    # Use agent from many threads, e.g. one game per thread
+    ...
+    print(b.metrics())
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+
+import numpy as np
+
+class InferenceBatcher:
+  """ Batch model calls of many games
+
+  The model takes a float tensor [n][3][height][width], the one hot
+  encoding of `Mock5.tensor()` for the player to move, and returns a
+  tensor whose first dim is n. Each request gets its own row of it.
+
+  Attributes:
+    model (torch.nn.Module): The model
+    height (int): Height of board
+    width (int): Width of board
+    max_batch_size (int): Maximum number of positions in a forward pass
+    max_latency (float): Seconds the oldest request may wait for a batch
+    device (torch.device?): Device of the model. Default is cpu.
+    n_batches (int): Number of forward passes
+    n_requests (int): Number of positions evaluated
+    batch_sizes (int[max_batch_size + 1]):
+      batch_sizes[n] = number of forward passes of n positions
+    queue_time (float): Total seconds requests waited before a forward pass
+    max_queue_time (float): Longest wait of a request
+    forward_time (float): Total seconds of forward passes
+  """
+  def __init__(self, model, height, width, max_batch_size=64,
+      max_latency=0.002, device=None, dtype=None):
+    import torch
+    if dtype is None: dtype = torch.float
+    self.model = model
+    self.height = height
+    self.width = width
+    self.max_batch_size = max_batch_size
+    self.max_latency = max_latency
+    self.device = device
+    self._batch = torch.zeros((max_batch_size, 3, height, width), dtype=dtype)
+    if device is not None and torch.device(device).type == 'cuda':
+      self._batch = self._batch.pin_memory()
+    self._boards = np.zeros((max_batch_size, height * width), dtype=np.uint8)
+    self._players = np.zeros((max_batch_size, 1), dtype=np.uint8)
+    self._queue = queue.Queue()
+    self._lock = threading.Lock()
+    self.reset_metrics()
+    self._closed = False
+    self._thread = threading.Thread(target=self._run, daemon=True)
+    self._thread.start()
+
+  def reset_metrics(self):
+    """ Reset all metrics
+    """
+    with self._lock:
+      self.n_batches = 0
+      self.n_requests = 0
+      self.batch_sizes = [0] * (self.max_batch_size + 1)
+      self.queue_time = 0.0
+      self.max_queue_time = 0.0
+      self.forward_time = 0.0
+
+  def metrics(self):
+    """ Summary of metrics
+
+    Returns:
+      dict: n_batches, n_requests, mean_batch_size, mean_queue_time,
+        max_queue_time, mean_forward_time, batch_sizes
+    """
+    with self._lock:
+      nb, nr = max(1, self.n_batches), max(1, self.n_requests)
+      return {
+        'n_batches': self.n_batches,
+        'n_requests': self.n_requests,
+        'mean_batch_size': self.n_requests / nb,
+        'mean_queue_time': self.queue_time / nr,
+        'max_queue_time': self.max_queue_time,
+        'mean_forward_time': self.forward_time / nb,
+        'batch_sizes': list(self.batch_sizes),
+      }
+
+  def submit(self, game, player=None):
+    """ Request an evaluation of the game's position
+
+    The board is copied, so the game may be changed right after.
+
+    Args:
+      game (Mock5): The game. Its size should be the same as batcher's.
+      player (int?): 1 or 2. Default value is current player.
+
+    Returns:
+      concurrent.futures.Future: Result row of the model (a copy).
+        Cancelling it before the forward pass drops the request.
+    """
+    if game.height != self.height or game.width != self.width:
+      raise ValueError("Board size is different from the batcher's")
+    if player is None: player = game.player
+    f = Future()
+    req = (bytes(game.board), player, f, time.perf_counter())
+    # Not to put a request after the stop sign of close
+    with self._lock:
+      if self._closed: raise RuntimeError("Batcher is closed")
+      self._queue.put(req)
+    return f
+
+  def __call__(self, game, player=None):
+    """ Evaluate the game's position, blocking until the result is ready
+    """
+    return self.submit(game, player).result()
+
+  async def evaluate(self, game, player=None):
+    """ Evaluate the game's position in an asyncio task
+    """
+    import asyncio
+    return await asyncio.wrap_future(self.submit(game, player))
+
+  def close(self):
+    """ Stop the worker after pending requests are done
+    """
+    with self._lock:
+      if self._closed: return
+      self._closed = True
+      self._queue.put(None)
+    self._thread.join()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+  def _gather(self):
+    """
+    Wait for requests and return a batch of them, or None to stop
+    """
+    while True:
+      first = self._queue.get()
+      if first is None: return None
+      # Cancelled requests (e.g. by a timeout of the caller) are dropped
+      if first[2].set_running_or_notify_cancel(): break
+    reqs = [first]
+    deadline = first[3] + self.max_latency
+    while len(reqs) < self.max_batch_size:
+      t = deadline - time.perf_counter()
+      try:
+        r = self._queue.get_nowait() if t <= 0 else self._queue.get(timeout=t)
+      except queue.Empty:
+        break
+      if r is None:
+        # Serve pending requests, then stop
+        self._queue.put(None)
+        break
+      if r[2].set_running_or_notify_cancel(): reqs.append(r)
+    return reqs
+
+  def _encode(self, reqs):
+    n = len(reqs)
+    bd = self._boards[:n]
+    bd[:] = np.frombuffer(b"".join(r[0] for r in reqs),
+                          dtype=np.uint8).reshape(n, -1)
+    pl = self._players[:n]
+    pl[:, 0] = [r[1] for r in reqs]
+    out = self._batch.numpy()[:n].reshape(n, 3, -1)
+    out[:, 0] = bd == 0
+    out[:, 1] = bd == pl
+    out[:, 2] = (bd != 0) & (bd != pl)
+    return self._batch[:n]
+
+  def _run(self):
+    while True:
+      reqs = self._gather()
+      if reqs is None: break
+      try:
+        self._serve(reqs)
+      except Exception as e:
+        # Never let the worker die, or later requests would wait forever
+        for r in reqs: _deliver(r[2], exception=e)
+    # Fail requests left behind, if any
+    while True:
+      try:
+        r = self._queue.get_nowait()
+      except queue.Empty:
+        break
+      if r is not None and r[2].set_running_or_notify_cancel():
+        _deliver(r[2], exception=RuntimeError("Batcher is closed"))
+
+  def _serve(self, reqs):
+    import torch
+    n = len(reqs)
+    start = time.perf_counter()
+    try:
+      x = self._encode(reqs)
+      if self.device is not None:
+        x = x.to(self.device, non_blocking=True)
+      with torch.no_grad():
+        y = self.model(x)
+      y = y.detach().cpu()
+    except Exception as e:
+      for r in reqs: _deliver(r[2], exception=e)
+      return
+    end = time.perf_counter()
+    # Copy rows, not to keep (or share) the whole output batch
+    for i, r in enumerate(reqs): _deliver(r[2], y[i].clone())
+    waits = [start - r[3] for r in reqs]
+    with self._lock:
+      self.n_batches += 1
+      self.n_requests += n
+      self.batch_sizes[n] += 1
+      self.queue_time += sum(waits)
+      self.max_queue_time = max(self.max_queue_time, max(waits))
+      self.forward_time += end - start
+
+def _deliver(f, result=None, exception=None):
+  """
+  Set the result of a future, unless it's already done
+  """
+  if f.done(): return
+  try:
+    if exception is not None: f.set_exception(exception)
+    else: f.set_result(result)
+  except InvalidStateError:
+    pass
+
+def batched_agent(batcher, asynchronous=False):
+  """ Agent choosing the best legal move from batched model outputs
+
+  It's a batched version of `model_wrapper` of `example_of_Mock5`.
+  The model should return scores of [n][height * width] (or any shape of
+  n rows of height * width scores).
+
+  Args:
+    batcher (InferenceBatcher): The batcher
+    asynchronous (bool): Make an async agent (for `mock5.server`)
+
+  Returns:
+    (Mock5) => (int, int): An agent
+  """
+  def choose(game, y):
+    y = y.reshape(-1).numpy().astype(np.float64)
+    y[np.array(game.board) != 0] = -np.inf
+    if not np.isfinite(y).any(): return None
+    return game._expand_index(int(np.argmax(y)))
+  if asynchronous:
+    async def player(game):
+      return choose(game, await batcher.evaluate(game))
+  else:
+    def player(game):
+      return choose(game, batcher(game))
+  player.name = "agent-batched"
+  return player
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""mock5 clock
+
+Author: lumiknit (aasr4r4@gmail.com)
+
+Time controls for `Mock5.play`.
+
+Agents are plain `agent(game)` callables. An agent which can stop by
+itself may set `agent.timed = True`; then it's called as
+`agent(game, deadline=deadline)`, where deadline is a `time.perf_counter()`
+value (or None if there is no limit), and it should return a move before
+the deadline.
+
+Agents are called synchronously, so a clock cannot interrupt them.
+Instead, the time used is measured for every move, and a move made too
+late is handled by the timeout policy.
+
+Example:
+  from mock5 import Mock5
+  from mock5.clock import TimeControl
+  tc = TimeControl(move_time=1.0, total_time=60.0, on_timeout='default')
+  winner = Mock5().play(agent1, agent2, time_control=tc)
+  print(tc.used[1], tc.used[2], tc.timeouts)
+"""
+
+import time
+
+class TimeControl:
+  """ Per-move and total clocks of two players
+
+  Attributes:
+    move_time (float?): Seconds for each move. None means no limit.
+    total_time (float?): Seconds for all moves of a player in a game.
+      None means no limit.
+    on_timeout ('forfeit' | 'default'):
+      'forfeit': a player who exceeds the time loses the game.
+      'default': the late move is replaced by a move of `default_agent`.
+    default_agent ((Mock5) => (int, int)?):
+      Agent for 'default' policy. Default is a random legal move.
+    grace (float): Extra seconds allowed for each move before timeout
+    used (float[3]): used[i] = seconds used by input i (1 or 2) of `play`
+    moves (int[3]): moves[i] = number of moves made by input i
+    timeouts (int[3]): timeouts[i] = number of timeouts of input i
+  """
+  def __init__(self, move_time=None, total_time=None, on_timeout='forfeit',
+      default_agent=None, grace=0.0):
+    if on_timeout not in ('forfeit', 'default'):
+      raise ValueError("on_timeout should be 'forfeit' or 'default'")
+    self.move_time = move_time
+    self.total_time = total_time
+    self.on_timeout = on_timeout
+    self.default_agent = default_agent
+    self.grace = grace
+    self.reset()
+
+  def reset(self):
+    """ Reset clocks for a new game
+    """
+    self.used = [None, 0.0, 0.0]
+    self.moves = [None, 0, 0]
+    self.timeouts = [None, 0, 0]
+
+  def budget(self, idx):
+    """ Seconds input idx can use for the next move
+
+    Returns:
+      float | None: None if there is no limit
+    """
+    b = self.move_time
+    if self.total_time is not None:
+      left = max(0.0, self.total_time - self.used[idx])
+      b = left if b is None else min(b, left)
+    return b
+
+  def call(self, agent, game, idx):
+    """ Ask agent for a move under the clock of input idx
+
+    Args:
+      agent ((Mock5) => (int, int)): The agent
+      game (Mock5): The game
+      idx (1 | 2): Which input of `play` the agent is
+
+    Returns:
+      Any: Return value of agent, or of `default_agent` on timeout with
+        'default' policy
+      bool: True iff the agent exceeded its time
+    """
+    b = self.budget(idx)
+    start = time.perf_counter()
+    deadline = None if b is None else start + b
+    if getattr(agent, "timed", False): ret = agent(game, deadline=deadline)
+    else: ret = agent(game)
+    elapsed = time.perf_counter() - start
+    self.used[idx] += elapsed
+    self.moves[idx] += 1
+    timeout = b is not None and elapsed > b + self.grace
+    if timeout:
+      self.timeouts[idx] += 1
+      if self.on_timeout == 'default':
+        if self.default_agent is not None: ret = self.default_agent(game)
+        else:
+          i = game.random_legal_move()
+          ret = None if i is None else game._expand_index(i)
+    return ret, timeout
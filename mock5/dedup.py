@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""mock5 dedup
+
+Author: lumiknit (aasr4r4@gmail.com)
+
+Symmetry-canonical deduplication of positions in gen2 record corpora.
+
+Every position (the board after each move) is mapped to its minimal D4
+representative (see `mock5.symmetry`), and duplicates are merged into one
+row with the number of visits and the mean outcome for black.
+
+It runs out-of-core in two phases:
+  1. Map: games are split into shards. Each worker canonicalizes positions
+     chunk by chunk, and appends them to partition files chosen by hash.
+  2. Reduce: each partition (small enough to fit in RAM) is deduplicated by
+     a worker, and partitions are concatenated into the output.
+
+Example:
+  # Deduplicate 11x11 records into positions.npy
+  python -m mock5.dedup positions.npy 11 11 out1 out2
+"""
+
+import os
+import numpy as np
+
+from mock5 import record, symmetry
+
+def dedup_dtype(height, width):
+  """ Row type of a deduplicated dataset
+
+  Fields:
+    key (uint64[k]): Canonical board packed by `symmetry.pack_boards`
+    count (uint32): Number of occurrences
+    value (float32): Mean outcome for black (1 win, -1 lose, 0 draw)
+  """
+  k = -(-height * width // symmetry.CELLS_PER_WORD)
+  return np.dtype([('key', '<u8', (k,)), ('count', '<u4'), ('value', '<f4')])
+
+def _map_shard(task):
+  filename, heads, height, width, n_partitions, tmpdir, chunk = task
+  # Shards run in the same worker append to the same files
+  tag = os.getpid()
+  dt = dedup_dtype(height, width)
+  pairs = record.open_record(filename)
+  files = {}
+  try:
+    for s in range(0, len(heads), chunk):
+      h = heads[s : s + chunk]
+      boards, game, _ = record.game_positions(pairs, h, height, width)
+      if len(boards) == 0: continue
+      keys, _ = symmetry.canonical_words(boards, height, width)
+      part = symmetry.hash_words(keys) % np.uint64(n_partitions)
+      rows = np.empty(len(keys), dtype=dt)
+      rows['key'] = keys
+      rows['count'] = 1
+      rows['value'] = record.game_outcomes(pairs, h)[game]
+      order = np.argsort(part, kind='stable')
+      rows, part = rows[order], part[order]
+      bounds = np.searchsorted(part, np.arange(n_partitions + 1))
+      for p in range(n_partitions):
+        if bounds[p] == bounds[p + 1]: continue
+        if p not in files:
+          files[p] = open(os.path.join(
+              tmpdir, "part-{:05d}-{}.bin".format(p, tag)), "ab")
+        rows[bounds[p] : bounds[p + 1]].tofile(files[p])
+  finally:
+    for f in files.values(): f.close()
+  return int(heads.size)
+
+def _reduce_partition(task):
+  p, paths, height, width, tmpdir = task
+  dt = dedup_dtype(height, width)
+  rows = np.concatenate([np.fromfile(path, dtype=dt) for path in paths])
+  for path in paths: os.remove(path)
+  keys = np.ascontiguousarray(rows['key'])
+  flat = keys.view(np.dtype((np.void, keys.dtype.itemsize * keys.shape[1])))
+  _, first, inv = np.unique(
+      flat.reshape(-1), return_index=True, return_inverse=True)
+  inv = inv.reshape(-1)
+  count = np.bincount(inv, weights=rows['count'])
+  value = np.bincount(inv, weights=rows['count'] * rows['value'].astype(float))
+  out = np.empty(len(first), dtype=dt)
+  out['key'] = keys[first]
+  out['count'] = count
+  out['value'] = value / count
+  path = os.path.join(tmpdir, "reduced-{:05d}.bin".format(p))
+  out.tofile(path)
+  return path, len(out)
+
+def _run(fn, tasks, processes):
+  if processes == 1:
+    return [fn(t) for t in tasks]
+  import multiprocessing
+  with multiprocessing.Pool(processes) as pool:
+    return pool.map(fn, tasks, chunksize=1)
+
+def dedup_records(filenames, height, width, out, n_partitions=64,
+    processes=None, tmpdir=None, chunk_games=1024):
+  """ Deduplicate positions of record files
+
+  Args:
+    filenames (str[]): gen2 record files
+    height (int): Height of board
+    width (int): Width of board
+    out (str): Output .npy file. See `dedup_dtype` for its rows.
+    n_partitions (int):
+      Number of hash partitions. Each partition should fit in RAM,
+      so use more partitions for larger corpora.
+    processes (int?): Number of worker processes. Default is cpu count.
+      1 runs everything in this process.
+    tmpdir (str?): Directory for partition files.
+      Default is a temporary directory next to out.
+    chunk_games (int): Games canonicalized at once by a worker
+
+  Returns:
+    int: Number of distinct positions
+  """
+  import tempfile
+  import shutil
+  if processes is None: processes = os.cpu_count() or 1
+  own_tmp = tmpdir is None
+  if own_tmp:
+    tmpdir = tempfile.mkdtemp(
+        prefix="mock5-dedup-", dir=os.path.dirname(os.path.abspath(out)))
+  try:
+    # Map
+    for _ in record.map_shards(
+        _map_shard, filenames, height, width,
+        (height, width, n_partitions, tmpdir, chunk_games),
+        processes=processes):
+      pass
+    # Reduce
+    tasks = []
+    for p in range(n_partitions):
+      prefix = "part-{:05d}-".format(p)
+      paths = [os.path.join(tmpdir, x) for x in sorted(os.listdir(tmpdir))
+               if x.startswith(prefix)]
+      if len(paths) > 0:
+        tasks.append((p, paths, height, width, tmpdir))
+    reduced = _run(_reduce_partition, tasks, processes)
+    # Concatenate
+    dt = dedup_dtype(height, width)
+    total = sum(n for _, n in reduced)
+    res = np.lib.format.open_memmap(out, mode='w+', dtype=dt, shape=(total,))
+    i = 0
+    for path, n in reduced:
+      res[i : i + n] = np.fromfile(path, dtype=dt)
+      os.remove(path)
+      i += n
+    res.flush()
+    del res
+    return total
+  finally:
+    if own_tmp: shutil.rmtree(tmpdir, ignore_errors=True)
+
+def load_dedup(filename):
+  """ Memory-map a deduplicated dataset
+
+  Returns:
+    numpy.array[N]: Rows of `dedup_dtype`
+  """
+  return np.load(filename, mmap_mode='r')
+
+def dedup_boards(rows, height, width):
+  """ Unpack canonical boards of deduplicated rows
+
+  Returns:
+    numpy.array(uint8)[N][height * width]: Board filled with 0, 1, 2
+  """
+  return symmetry.unpack_boards(rows['key'], height * width)
+
+if __name__ == "__main__":
+  import sys
+  if len(sys.argv) < 5:
+    print("Usage: {} <OUT> <HEIGHT> <WIDTH> <RECORD>...".format(sys.argv[0]))
+    sys.exit(1)
+  n = dedup_records(sys.argv[4:], int(sys.argv[2]), int(sys.argv[3]),
+                    sys.argv[1])
+  print("{} distinct positions".format(n))
@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""mock5 opening book
+
+Author: lumiknit (aasr4r4@gmail.com)
+
+Opening book built from gen2 records (see `mock5.record`).
+
+For each position in the first plies of games, the book stores statistics
+of the next moves (how many times played, mean outcome for the mover).
+Positions are canonicalized over D4 symmetries (see `mock5.symmetry`), and
+moves are stored in the canonical orientation. Lookups map them back to the
+orientation of the given game.
+
+The book is a single file:
+  header (int64[8]): magic, version, height, width, n_slots, n_moves,
+    max_ply, 0
+  slots (n_slots rows of `SLOT_DTYPE`): open-addressing hash table
+    of position hashes. hash 0 is an empty slot.
+  moves (n_moves rows of `MOVE_DTYPE`): moves of each position,
+    slots[i] owns moves[start : start + length]
+It is memory-mapped, so loading costs nothing and lookups are O(1).
+Positions are identified by their 64-bit hash only.
+
+Example:
+  # Build a book of first 8 plies from 15x15 records
+  python -m mock5.opening_book book.bin 15 15 out1 out2
+"""
+
+import numpy as np
+
+from mock5 import record, symmetry
+
+MAGIC = 0x4b4f4f4235434f4d # 'MOC5BOOK'
+VERSION = 1
+
+SLOT_DTYPE = np.dtype([('hash', '<u8'), ('start', '<u4'), ('length', '<u4')])
+MOVE_DTYPE = np.dtype([('move', '<u2'), ('count', '<u4'), ('score', '<f4')])
+
+def position_hashes(boards, height, width):
+  """ Canonical hash and symmetry index of boards
+
+  Args:
+    boards (numpy.array[N][height * width]): Boards filled with 0, 1, 2
+
+  Returns:
+    numpy.array(uint64)[N]: Hash of canonical board (never 0)
+    numpy.array(uint8)[N]: Symmetry index which maps board to canonical one
+  """
+  words, sym = symmetry.canonical_words(boards, height, width)
+  h = symmetry.hash_words(words)
+  h[h == 0] = 1
+  return h, sym
+
+def _collect_shard(task):
+  filename, heads, height, width, max_ply, chunk = task
+  pairs = record.open_record(filename)
+  fw = np.array([symmetry.forward_table(height, width, k)
+                 for k in range(symmetry.N_SYMMETRIES)], dtype=np.int64)
+  hs, ms, ss = [], [], []
+  for i in range(0, len(heads), chunk):
+    h = heads[i : i + chunk]
+    bd, game, ply = record.game_positions(pairs, h, height, width)
+    idx, _, _ = record.game_moves(pairs, h)
+    # Position before each move
+    t = np.flatnonzero(ply < max_ply)
+    before = np.zeros((len(t), height * width), dtype=np.uint8)
+    p = ply[t] > 0
+    before[p] = bd[t[p] - 1]
+    ph, sym = position_hashes(before, height, width)
+    # Outcome for the mover
+    out = record.game_outcomes(pairs, h)[game[t]].astype(np.float32)
+    out[ply[t] % 2 == 1] *= -1
+    hs.append(ph)
+    ms.append(fw[sym, idx[t]])
+    ss.append(out)
+  if len(hs) == 0:
+    return (np.zeros(0, np.uint64), np.zeros(0, np.int64),
+            np.zeros(0, np.uint32), np.zeros(0, np.float32))
+  hs, ms, ss = np.concatenate(hs), np.concatenate(ms), np.concatenate(ss)
+  return _reduce(hs, ms, np.ones(len(hs), dtype=np.uint32), ss)
+
+def _reduce(hs, ms, cs, ss):
+  """ Merge rows with the same (hash, move), sorted by them
+  """
+  if len(hs) == 0: return hs, ms, cs, ss
+  order = np.lexsort((ms, hs))
+  hs, ms, cs, ss = hs[order], ms[order], cs[order], ss[order]
+  new = np.ones(len(hs), dtype=bool)
+  new[1:] = (hs[1:] != hs[:-1]) | (ms[1:] != ms[:-1])
+  first = np.flatnonzero(new)
+  return (hs[first], ms[first], np.add.reduceat(cs, first),
+          np.add.reduceat(ss, first))
+
+class OpeningBook:
+  """ Opening book
+
+  Use `OpeningBook.build` to make a book file, and `OpeningBook(filename)`
+  to load it.
+
+  Attributes:
+    height (int): Height of board
+    width (int): Width of board
+    max_ply (int): Positions with fewer stones than it are in the book
+    slots (numpy.array[n_slots]): Hash table (`SLOT_DTYPE`)
+    moves (numpy.array[n_moves]): Move statistics (`MOVE_DTYPE`)
+  """
+  def __init__(self, filename):
+    header = np.fromfile(filename, dtype='<i8', count=8)
+    if len(header) < 8 or header[0] != MAGIC or header[1] != VERSION:
+      raise ValueError("{} is not an opening book".format(filename))
+    _, _, h, w, n_slots, n_moves, max_ply, _ = map(int, header)
+    self.height = h
+    self.width = w
+    self.max_ply = max_ply
+    self._mask = n_slots - 1
+    off = header.nbytes
+    self.slots = np.memmap(filename, dtype=SLOT_DTYPE, mode='r',
+                           offset=off, shape=(n_slots,))
+    off += SLOT_DTYPE.itemsize * n_slots
+    if n_moves > 0:
+      self.moves = np.memmap(filename, dtype=MOVE_DTYPE, mode='r',
+                             offset=off, shape=(n_moves,))
+    else:
+      self.moves = np.zeros(0, dtype=MOVE_DTYPE)
+
+  @classmethod
+  def build(cls, filenames, height, width, out, max_ply=8, min_count=1,
+      processes=None, chunk_games=4096):
+    """ Build a book file from records
+
+    Args:
+      filenames (str[]): gen2 record files
+      height (int): Height of board
+      width (int): Width of board
+      out (str): Output book file
+      max_ply (int): Collect positions before the max_ply-th move
+      min_count (int): Drop moves played fewer times than it
+      processes (int?): Number of worker processes. Default is cpu count.
+        1 runs everything in this process.
+      chunk_games (int): Games decoded at once by a worker
+
+    Returns:
+      OpeningBook: The built book
+    """
+    if height * width > 65536:
+      raise ValueError("Board is too large for an opening book")
+    parts = list(record.map_shards(
+        _collect_shard, filenames, height, width,
+        (height, width, max_ply, chunk_games), processes=processes))
+    if len(parts) == 0:
+      parts = [(np.zeros(0, np.uint64), np.zeros(0, np.int64),
+                np.zeros(0, np.uint32), np.zeros(0, np.float32))]
+    hs, ms, cs, ss = (np.concatenate(x) for x in zip(*parts))
+    hs, ms, cs, ss = _reduce(hs, ms, cs, ss)
+    keep = cs >= min_count
+    hs, ms, cs, ss = hs[keep], ms[keep], cs[keep], ss[keep]
+    moves = np.empty(len(hs), dtype=MOVE_DTYPE)
+    moves['move'] = ms
+    moves['count'] = cs
+    moves['score'] = ss
+    # Positions
+    new = np.ones(len(hs), dtype=bool)
+    new[1:] = hs[1:] != hs[:-1]
+    start = np.flatnonzero(new)
+    length = np.diff(np.append(start, len(hs)))
+    ph = hs[start]
+    n_slots = 1
+    while n_slots < 2 * len(ph): n_slots *= 2
+    slots = np.zeros(n_slots, dtype=SLOT_DTYPE)
+    # Linear probing, all pending positions at once
+    mask = np.uint64(n_slots - 1)
+    pending = np.arange(len(ph))
+    pos = (ph & mask).astype(np.int64)
+    while len(pending) > 0:
+      free = slots['hash'][pos] == 0
+      _, first = np.unique(pos, return_index=True)
+      win = np.zeros(len(pending), dtype=bool)
+      win[first] = True
+      win &= free
+      p, i = pos[win], pending[win]
+      slots['hash'][p] = ph[i]
+      slots['start'][p] = start[i]
+      slots['length'][p] = length[i]
+      pending, pos = pending[~win], (pos[~win] + 1) & (n_slots - 1)
+    header = np.array([MAGIC, VERSION, height, width, n_slots, len(moves),
+                       max_ply, 0], dtype='<i8')
+    with open(out, "wb") as f:
+      header.tofile(f)
+      slots.tofile(f)
+      moves.tofile(f)
+    return cls(out)
+
+  def __len__(self):
+    """ Number of positions in the book
+    """
+    return int(np.count_nonzero(self.slots['hash']))
+
+  def lookup(self, game):
+    """ Find move statistics of the game's position
+
+    Args:
+      game (Mock5): The game. Its size should be the same as book's.
+
+    Returns:
+      None | (numpy.array(int64)[n], numpy.array(uint32)[n],
+          numpy.array(float32)[n]):
+        None if the position is not in the book. Otherwise,
+        board indices of moves (in the game's orientation), how many times
+        each move was played, and mean outcome (1 win, -1 lose) for the mover
+    """
+    if game.height != self.height or game.width != self.width: return None
+    if len(game.history) >= self.max_ply: return None
+    h, sym = position_hashes(
+        np.array([game.board], dtype=np.uint8), self.height, self.width)
+    h, k = h[0], int(sym[0])
+    i = int(h) & self._mask
+    while True:
+      s = self.slots[i]
+      if s['hash'] == 0: return None
+      if s['hash'] == h: break
+      i = (i + 1) & self._mask
+    m = self.moves[int(s['start']) : int(s['start']) + int(s['length'])]
+    g = np.array(symmetry.gather_table(self.height, self.width, k))
+    count = m['count']
+    return g[m['move']], count, m['score'] / count
+
+  def policy(self, game, min_count=1):
+    """ Move weights from the book
+
+    Returns:
+      None | numpy.array[height * width]:
+        None if the position is not in the book. Otherwise, how many times
+        each cell was played (only moves played at least min_count times).
+    """
+    r = self.lookup(game)
+    if r is None: return None
+    idx, count, _ = r
+    ok = count >= min_count
+    if not ok.any(): return None
+    p = np.zeros(self.height * self.width)
+    p[idx[ok]] = count[ok]
+    return p
+
+def book_agent(book, agent, min_count=1):
+  """ Wrap an agent to play from the book first
+
+  Args:
+    book (OpeningBook): The book
+    agent ((Mock5) => (int, int)): Agent used out of the book
+    min_count (int): Ignore moves played fewer times than it
+
+  Returns:
+    (Mock5) => (int, int): An agent, which chooses a move in the book
+      randomly in proportion to how many times it was played.
+  """
+  def player(game):
+    p = book.policy(game, min_count=min_count)
+    if p is not None:
+      p = p * (np.array(game.board) == 0)
+      s = p.sum()
+      if s > 0:
+        return game._expand_index(
+            int(np.random.choice(len(p), p=p / s)))
+    return agent(game)
+  player.name = "{}+book".format(getattr(agent, "name", "agent"))
+  return player
+
+if __name__ == "__main__":
+  import sys
+  if len(sys.argv) < 5:
+    print("Usage: {} <OUT> <HEIGHT> <WIDTH> <RECORD>...".format(sys.argv[0]))
+    sys.exit(1)
+  b = OpeningBook.build(sys.argv[4:], int(sys.argv[2]), int(sys.argv[3]),
+                        sys.argv[1])
+  print("{} positions, {} moves".format(len(b), len(b.moves)))
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""mock5 ponder
+
+Author: lumiknit (aasr4r4@gmail.com)
+
+Pondering: let an agent think during the opponent's turn.
+
+`Ponderer` wraps an agent. While the opponent (usually a human blocked on
+`input()`) is thinking, a background thread guesses likely replies and
+computes the agent's answer to each of them on a private copy of the game.
+When the real reply is one of the guesses, the agent answers instantly.
+
+`Mock5.play(..., ponder=True)` uses it for games between a user and an
+agent.
+
+The background thread draws random numbers from its own `random.Random`,
+not from the `random` module, so pondering does not change random choices
+of the main thread. An agent with `seeded = True` attribute is called as
+`agent(game, rng=rng)` while pondering, and should use rng instead of the
+`random` module.
+"""
+
+import random
+import threading
+
+def guess_replies(game, n, rng=None):
+  """ Guess likely replies with `agent_analysis_based.policy`
+
+  Args:
+    game (Mock5): The game
+    n (int): Number of replies
+    rng (random.Random?): Random source. Default is the `random` module.
+
+  Returns:
+    int[]: At most n indices of empty cells, the most likely first
+  """
+  import numpy as np
+  from mock5.agent_analysis_based import policy
+  p = policy(game, rng)
+  order = np.argsort(-p, kind='stable')[:n]
+  return [int(i) for i in order if game.board[i] == 0]
+
+class Ponderer:
+  """ Agent wrapper which ponders in a background thread
+
+  Call `start(game)` when the opponent is to move, and use the ponderer
+  itself as the agent. Any result which is not used is discarded.
+  Pondering stops when the ponderer is called or cancelled, without
+  waiting for an agent call running in the background; its result is
+  discarded. The thread is joined by the next `start` and by `close`.
+
+  Attributes:
+    agent ((Mock5) => (int, int)): Wrapped agent
+    guess ((Mock5, int, random.Random) => int[]):
+      Guess n likely replies of a game
+    rng (random.Random): Random source of the background thread
+    n_guesses (int): Number of replies to ponder
+    name (str): Name of the wrapped agent
+    hits (int): Number of moves answered from pondering
+    misses (int): Number of moves computed after the real reply
+  """
+  def __init__(self, agent, guess=guess_replies, n_guesses=8, seed=None):
+    self.agent = agent
+    self.guess = guess
+    self.rng = random.Random(seed)
+    self.n_guesses = n_guesses
+    self.name = getattr(agent, "name", str(agent))
+    self.timed = getattr(agent, "timed", False)
+    self.hits = 0
+    self.misses = 0
+    self._cond = threading.Condition()
+    self._stop = threading.Event()
+    self._cache = {}
+    self._busy = None
+    self._thread = None
+
+  def start(self, game):
+    """ Start pondering on game, where the opponent is to move
+
+    Previous pondering is cancelled, and its thread is joined.
+    """
+    self.close()
+    stop = threading.Event()
+    with self._cond: self._stop = stop
+    self._thread = threading.Thread(
+        target=self._run, args=(game.transform(0), stop), daemon=True)
+    self._thread.start()
+
+  def cancel(self):
+    """ Cancel pondering and drop its results
+
+    It does not wait for the thread. An agent call already running in the
+    background goes on, but the stop event is checked after it, so its
+    result is discarded.
+    """
+    with self._cond:
+      self._stop.set()
+      self._cache = {}
+      self._busy = None
+      self._cond.notify_all()
+
+  def close(self):
+    """ Cancel pondering and join the thread
+    """
+    self.cancel()
+    t, self._thread = self._thread, None
+    if t is not None: t.join()
+
+  def _run(self, game, stop):
+    seeded = getattr(self.agent, "seeded", False)
+    try:
+      replies = self.guess(game, self.n_guesses, self.rng)
+    except Exception:
+      return
+    for idx in replies:
+      if stop.is_set(): return
+      game.push(idx)
+      key = tuple(game.history)
+      with self._cond:
+        if stop.is_set(): return
+        self._busy = key
+      move = None
+      try:
+        if game.check_win_at(idx) is None and game.num_legal() > 0:
+          if seeded: move = self.agent(game, rng=self.rng)
+          else: move = self.agent(game)
+      except Exception:
+        pass
+      game.pop()
+      with self._cond:
+        if stop.is_set(): return
+        if move is not None: self._cache[key] = move
+        self._busy = None
+        self._cond.notify_all()
+
+  def __call__(self, game, deadline=None):
+    key = tuple(game.history)
+    with self._cond:
+      # The reply is being pondered now; wait for it rather than restart
+      while self._busy == key and not self._stop.is_set():
+        self._cond.wait()
+      move = self._cache.get(key)
+    self.cancel()
+    if move is not None:
+      self.hits += 1
+      return move
+    self.misses += 1
+    if self.timed: return self.agent(game, deadline=deadline)
+    return self.agent(game)
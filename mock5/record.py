@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""mock5 record
+
+Author: lumiknit (aasr4r4@gmail.com)
+
+Bulk reader and writer for gen2 records (generated by `mock5.selfplay`,
+gen2_record/gen.cpp, or `Mock5.make_history_int_pair_array`).
+
+A record file is a flat array of int32 pairs.
+Each game begins with a header pair (WINNER, NUM_MOVES), and NUM_MOVES pairs
+(INDEX, SCORE) follow it. WINNER is 1 (black), 2 (white) or 0 (draw).
+INDEX is `row * width + col`, and black places the first stone.
+
+Files are memory-mapped, thus they need not to fit in RAM.
+`RecordWriter` appends games, and survives crashes by writing only whole
+games and cutting a truncated game off when a file is reopened.
+"""
+
+import numpy as np
+
+RECORD_DTYPE = np.dtype('<i4')
+
+def open_record(filename):
+  """ Memory-map a record file
+
+  Returns:
+    numpy.array(int32)[n][2]: Read-only int pairs
+
+  Raises:
+    ValueError: The file size is not a multiple of 8 bytes
+  """
+  import os
+  size = os.path.getsize(filename)
+  if size % (2 * RECORD_DTYPE.itemsize) != 0:
+    raise ValueError("Record size is not a multiple of an int pair")
+  if size == 0: return np.zeros((0, 2), dtype=RECORD_DTYPE)
+  return np.memmap(filename, dtype=RECORD_DTYPE, mode='r').reshape(-1, 2)
+
+def scan_games(pairs, start=0, stop=None, max_length=None):
+  """ Find header of each game
+
+  Only headers are visited, so the cost is O(number of games).
+
+  Args:
+    pairs (numpy.array[n][2]): Int pairs (see `open_record`)
+    start (int): Pair index of the first header
+    stop (int?): Pair index to stop scanning. Default is the end.
+    max_length (int?):
+      If it's given, a header with larger NUM_MOVES is considered corrupted
+      (usually height * width).
+
+  Returns:
+    numpy.array(int64)[G]: Pair index of each complete game's header
+    int: Pair index where scanning stopped.
+      If it's not `stop`, the game at that index is truncated or corrupted.
+  """
+  if stop is None: stop = len(pairs)
+  lengths = pairs[:, 1]
+  heads = []
+  p = start
+  while p < stop:
+    l = int(lengths[p])
+    if l < 0 or p + 1 + l > stop: break
+    if max_length is not None and l > max_length: break
+    heads.append(p)
+    p += 1 + l
+  return np.array(heads, dtype=np.int64), p
+
+def split_games(heads, n):
+  """ Split headers into at most n contiguous shards
+
+  Returns:
+    list(numpy.array(int64)): Non-empty shards of heads
+  """
+  if len(heads) == 0: return []
+  return [s for s in np.array_split(heads, min(n, len(heads))) if len(s) > 0]
+
+def map_shards(fn, filenames, height, width, args=(), processes=None,
+    on_corrupt=None, ordered=True):
+  """ Run fn over shards of games of record files
+
+  Each file is scanned by `scan_games`, its games are split into about
+  4 * processes shards (see `split_games`), and fn((filename, heads) + args)
+  is called for each shard, over a process pool.
+
+  Args:
+    fn (tuple => any): Shard function. It should be a module-level
+      function to be sent to other processes.
+    filenames (str[]): Record files
+    height (int): Height of board
+    width (int): Width of board
+    args (tuple): Extra items of each task
+    processes (int?): Number of worker processes. Default is cpu count.
+      1 runs everything in this process.
+    on_corrupt ((str, int, str) => None?): Called with (filename, pair
+      index, message) for a corrupted file, and complete games before the
+      corruption are still processed. Default raises ValueError.
+    ordered (bool): If False, results are yielded as soon as they're ready
+
+  Yields:
+    any: Result of fn for each shard
+  """
+  import os
+  if processes is None: processes = os.cpu_count() or 1
+  tasks = []
+  for filename in filenames:
+    try:
+      pairs = open_record(filename)
+    except ValueError as e:
+      if on_corrupt is None: raise ValueError("{}: {}".format(filename, e))
+      on_corrupt(filename, 0, str(e))
+      continue
+    heads, end = scan_games(pairs, max_length=height * width)
+    if end != len(pairs):
+      msg = "truncated or broken header (length {})".format(pairs[end, 1])
+      if on_corrupt is None:
+        raise ValueError("{}: record is corrupted at pair {}: {}"
+                         .format(filename, end, msg))
+      on_corrupt(filename, end, msg + "; the rest of file is skipped")
+    for shard in split_games(heads, 4 * processes):
+      tasks.append((filename, shard) + tuple(args))
+  if processes == 1:
+    for t in tasks: yield fn(t)
+  else:
+    import multiprocessing
+    with multiprocessing.Pool(processes) as pool:
+      it = pool.imap if ordered else pool.imap_unordered
+      for r in it(fn, tasks): yield r
+
+def game_moves(pairs, heads):
+  """ Gather moves of games
+
+  Args:
+    pairs (numpy.array[n][2]): Int pairs (see `open_record`)
+    heads (numpy.array(int64)[G]): Header indices (see `scan_games`)
+
+  Returns:
+    numpy.array(int64)[M]: Board index of each move
+    numpy.array(int64)[M]: Game number (0 ~ G-1) of each move
+    numpy.array(int64)[M]: Ply (0-based) of each move
+  """
+  heads = np.asarray(heads, dtype=np.int64)
+  lengths = pairs[heads, 1].astype(np.int64)
+  n = int(lengths.sum())
+  game = np.repeat(np.arange(len(heads)), lengths)
+  first = np.cumsum(lengths) - lengths
+  ply = np.arange(n) - first[game]
+  idx = pairs[heads[game] + 1 + ply, 0].astype(np.int64)
+  return idx, game, ply
+
+def game_positions(pairs, heads, height, width):
+  """ Rebuild the board after each move
+
+  Args:
+    pairs (numpy.array[n][2]): Int pairs (see `open_record`)
+    heads (numpy.array(int64)[G]): Header indices (see `scan_games`)
+    height (int): Height of board
+    width (int): Width of board
+
+  Returns:
+    numpy.array(uint8)[M][height * width]: Board filled with 0, 1, 2
+    numpy.array(int64)[M]: Game number (0 ~ G-1) of each position
+    numpy.array(int64)[M]: Ply (0-based) of the last move of each position
+  """
+  idx, game, ply = game_moves(pairs, heads)
+  n = len(idx)
+  # Scatter each move into its own row, then accumulate rows of a game.
+  # uint8 may wrap around, but the difference below is still exact.
+  bd = np.zeros((n, height * width), dtype=np.uint8)
+  bd[np.arange(n), idx] = 1 + (ply % 2)
+  np.cumsum(bd, axis=0, dtype=np.uint8, out=bd)
+  start = np.arange(n) - ply
+  has_prev = start > 0
+  bd[has_prev] -= bd[start[has_prev] - 1]
+  return bd, game, ply
+
+def game_outcomes(pairs, heads):
+  """ Outcome for black of each game
+
+  Returns:
+    numpy.array(int8)[G]: 1 if black wins, -1 if white wins, 0 if draw
+  """
+  w = pairs[np.asarray(heads, dtype=np.int64), 0]
+  return np.choose(np.clip(w, 0, 2), [0, 1, -1]).astype(np.int8)
+
+def encode_games(winners, histories, scores=None):
+  """ Encode games into int pairs
+
+  Args:
+    winners (int[G]): 1 (black), 2 (white) or 0 (draw) of each game
+    histories (int[][G]): Board indices of moves of each game
+    scores (int[][G]?): Score of each move. Default is 0.
+
+  Returns:
+    numpy.array(int32)[n][2]: Int pairs of the games
+  """
+  lengths = [len(h) for h in histories]
+  out = np.zeros((len(lengths) + sum(lengths), 2), dtype=RECORD_DTYPE)
+  p = 0
+  for g, l in enumerate(lengths):
+    out[p] = (winners[g], l)
+    out[p + 1 : p + 1 + l, 0] = histories[g]
+    if scores is not None: out[p + 1 : p + 1 + l, 1] = scores[g]
+    p += 1 + l
+  return out
+
+class RecordWriter:
+  """ Appending writer of a record file
+
+  Games are buffered, and written at `flush` (fsync-ed by default).
+  When an existing file is opened, its games are counted by `scan_games`
+  and a truncated game at the tail (left by a crash while writing) is cut
+  off, so writing resumes right after the last complete game.
+
+  Example:
+    with RecordWriter("out.bin") as w:
+      print(w.n_games) # Games already in the file
+      w.write(1, [112, 113, 97, 98, 82, 83, 67, 68, 52])
+
+  Attributes:
+    filename (str): Record file
+    n_games (int): Number of complete games, including buffered ones
+    n_pairs (int): Number of int pairs, including buffered ones
+  """
+  def __init__(self, filename, max_length=None, fsync=True):
+    """ Open (or create) a record file for appending
+
+    Args:
+      filename (str): Record file
+      max_length (int?): See `scan_games`. Usually height * width.
+      fsync (bool): If True, `flush` waits until games reach the disk
+    """
+    import os
+    self.filename = filename
+    self.fsync = fsync
+    self._buffer = []
+    pair_size = 2 * RECORD_DTYPE.itemsize
+    size = os.path.getsize(filename) if os.path.exists(filename) else 0
+    if size % pair_size != 0:
+      size -= size % pair_size
+      os.truncate(filename, size)
+    self.n_games, self.n_pairs = 0, 0
+    if size > 0:
+      pairs = open_record(filename)
+      heads, end = scan_games(pairs, max_length=max_length)
+      del pairs
+      self.n_games, self.n_pairs = len(heads), end
+      if end * pair_size != size: os.truncate(filename, end * pair_size)
+    self._file = open(filename, "ab")
+
+  def write(self, winner, history, score=None):
+    """ Buffer a game
+
+    Args:
+      winner (int): 1 (black), 2 (white) or 0 (draw)
+      history (int[]): Board indices of moves. Black moves first.
+      score (int[]?): Score of each move. Default is 0.
+    """
+    self.write_pairs(encode_games(
+        [winner], [history], None if score is None else [score]), 1)
+
+  def write_pairs(self, pairs, n_games):
+    """ Buffer encoded games (see `encode_games`)
+
+    Args:
+      pairs (numpy.array(int32)[n][2]): Int pairs of whole games
+      n_games (int): Number of games in pairs
+    """
+    pairs = np.ascontiguousarray(pairs, dtype=RECORD_DTYPE)
+    self._buffer.append(pairs.tobytes())
+    self.n_games += n_games
+    self.n_pairs += len(pairs)
+
+  def flush(self):
+    """ Write buffered games to the file
+    """
+    import os
+    if len(self._buffer) == 0: return
+    self._file.write(b''.join(self._buffer))
+    self._buffer = []
+    self._file.flush()
+    if self.fsync: os.fsync(self._file.fileno())
+
+  def close(self):
+    """ Flush and close the file
+    """
+    if self._file is None: return
+    try:
+      self.flush()
+    finally:
+      self._file.close()
+      self._file = None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
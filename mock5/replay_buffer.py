@@ -0,0 +1,369 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""mock5 replay buffer
+
+Author: lumiknit (aasr4r4@gmail.com)
+
+Fixed-capacity replay buffer of Mock5 positions for RL training.
+
+Positions are stored compactly in numpy arrays:
+  board (uint8[height * width]): 0, 1, 2 as `Mock5.board`
+  player (uint8): Side to move
+  value (float32): Value label for the side to move
+  policy: Policy target, either sparse (top_k moves as uint16 indices and
+    float16 probabilities, renormalized) or dense (float16[height * width])
+With sparse policies of top_k = 8, a 15x15 position takes 266 bytes
+(with its priority), so 10M positions fit in about 2.7GB.
+
+The buffer is a ring: when it's full, the oldest positions are replaced.
+Sampling is uniform, or prioritized by a sum tree (proportional variant
+of prioritized experience replay). D4 symmetries can be applied to each
+sampled position (see `mock5.symmetry`).
+
+A buffer made with `directory` keeps all arrays in memory-mapped .npy
+files there. Call `flush` to persist, and `ReplayBuffer.load` to reopen.
+
+Example:
+  buf = ReplayBuffer(1000000, 15, 15, prioritized=True)
+  buf.add_games(games, values, policies)
+  b = buf.sample(256, tensor=True)
+  loss = (model(b.x) ...) * b.weight
+  buf.update_priorities(b.index, new_priorities)
+"""
+
+import os
+from collections import namedtuple
+
+import numpy as np
+
+from mock5 import symmetry
+
+Batch = namedtuple('Batch', ['x', 'policy', 'value', 'index', 'weight'])
+Batch.__doc__ = """ Sampled batch
+
+  Attributes:
+    x (numpy.array | torch.tensor)[B][3][height][width]: One hot encoding
+      for the side to move, same as `Mock5.numpy()`
+    policy (numpy.array | torch.tensor)(float32)[B][height * width]:
+      Policy targets (transformed with boards)
+    value (numpy.array | torch.tensor)(float32)[B]: Value labels
+    index (numpy.array(int64)[B]): Slots, for `update_priorities`
+    weight (numpy.array | torch.tensor)(float32)[B]: Importance sampling
+      weights (all 1 for uniform sampling)
+"""
+
+_FIELDS = ('boards', 'players', 'values', 'priorities', 'policy_idx',
+           'policy_prob', 'policy')
+
+class SumTree:
+  """ Sum tree of priorities, vectorised over numpy arrays
+
+  Attributes:
+    capacity (int): Number of leaves
+    tree (numpy.array(float64)[2 * size]): tree[1] is the root, leaves are
+      tree[size : size + capacity], where size is a power of 2
+  """
+  def __init__(self, capacity):
+    self.capacity = capacity
+    self.size = 1
+    while self.size < capacity: self.size *= 2
+    self.tree = np.zeros(2 * self.size)
+
+  @property
+  def total(self):
+    return float(self.tree[1])
+
+  def update(self, index, priority):
+    """ Set priorities of leaves, and update their ancestors
+    """
+    i = np.asarray(index, dtype=np.int64) + self.size
+    if len(i) == 0: return
+    self.tree[i] = priority
+    i = np.unique(i // 2)
+    while i[0] > 0:
+      self.tree[i] = self.tree[2 * i] + self.tree[2 * i + 1]
+      i = np.unique(i // 2)
+
+  def find(self, mass):
+    """ Leaves where prefix sums of priorities reach mass
+
+    Returns:
+      numpy.array(int64): Leaf indices
+    """
+    u = np.array(mass, dtype=np.float64)
+    i = np.ones(len(u), dtype=np.int64)
+    while i[0] < self.size:
+      left = self.tree[2 * i]
+      right = u >= left
+      u -= np.where(right, left, 0)
+      i = 2 * i + right
+    return np.minimum(i - self.size, self.capacity - 1)
+
+class ReplayBuffer:
+  """ Replay buffer of positions
+
+  Attributes:
+    capacity (int): Maximum number of positions
+    height (int): Height of board
+    width (int): Width of board
+    top_k (int): Moves kept in a sparse policy. 0 means dense policies.
+    prioritized (bool): Use prioritized sampling
+    alpha (float): Priority exponent of prioritized sampling
+    eps (float): Minimum priority, so every position can be sampled
+    size (int): Number of positions
+    pos (int): Next slot to write
+    boards (numpy.array(uint8)[capacity][height * width]): Boards
+    players (numpy.array(uint8)[capacity]): Side to move
+    values (numpy.array(float32)[capacity]): Value labels
+    priorities (numpy.array(float32)[capacity]): Priorities (before alpha)
+    policy_idx (numpy.array(uint16)[capacity][top_k]?): Sparse policy moves
+    policy_prob (numpy.array(float16)[capacity][top_k]?): Their weights
+    policy (numpy.array(float16)[capacity][height * width]?): Dense policy
+  """
+  def __init__(self, capacity, height, width, top_k=8, prioritized=False,
+      alpha=0.6, eps=1e-6, directory=None):
+    """ Constructor
+
+    Args:
+      capacity (int): Maximum number of positions
+      height (int): Height of board
+      width (int): Width of board
+      top_k (int): Moves kept in a sparse policy. 0 stores dense policies.
+      prioritized (bool): Use prioritized sampling
+      alpha (float): Priority exponent
+      eps (float): Minimum priority. Smaller ones (e.g. zero TD errors)
+        are raised to it.
+      directory (str?): Keep arrays in memory-mapped files in it
+    """
+    sz = height * width
+    if sz > 65536: raise ValueError("Board is too large")
+    self.capacity = capacity
+    self.height = height
+    self.width = width
+    self.top_k = top_k
+    self.prioritized = prioritized
+    self.alpha = alpha
+    self.eps = eps
+    self.directory = directory
+    self.size = 0
+    self.pos = 0
+    self._max_priority = 1.0
+    shapes = {
+      'boards': ((capacity, sz), np.uint8),
+      'players': ((capacity,), np.uint8),
+      'values': ((capacity,), np.float32),
+      'priorities': ((capacity,), np.float32),
+    }
+    if top_k > 0:
+      shapes['policy_idx'] = ((capacity, top_k), np.uint16)
+      shapes['policy_prob'] = ((capacity, top_k), np.float16)
+    else:
+      shapes['policy'] = ((capacity, sz), np.float16)
+    if directory is not None: os.makedirs(directory, exist_ok=True)
+    for name in _FIELDS:
+      if name not in shapes:
+        setattr(self, name, None)
+        continue
+      shape, dtype = shapes[name]
+      if directory is None: a = np.zeros(shape, dtype=dtype)
+      else:
+        a = np.lib.format.open_memmap(os.path.join(directory, name + '.npy'),
+                                      mode='w+', dtype=dtype, shape=shape)
+      setattr(self, name, a)
+    self._tree = SumTree(capacity) if prioritized else None
+    if directory is not None: self.flush()
+
+  def __len__(self):
+    return self.size
+
+  # Persistence
+
+  def flush(self):
+    """ Write arrays and state into the directory
+    """
+    if self.directory is None: raise ValueError("No directory to flush")
+    for name in _FIELDS:
+      a = getattr(self, name)
+      if isinstance(a, np.memmap): a.flush()
+    meta = np.array([self.capacity, self.height, self.width, self.top_k,
+                     self.size, self.pos, int(self.prioritized)],
+                    dtype=np.int64)
+    np.save(os.path.join(self.directory, 'meta.npy'), meta)
+    np.save(os.path.join(self.directory, 'alpha.npy'),
+            np.array([self.alpha, self._max_priority, self.eps]))
+
+  @classmethod
+  def load(cls, directory, mode='r+'):
+    """ Reopen a buffer flushed into directory
+
+    Args:
+      mode ('r+' | 'r' | 'c'): Mode of memory maps. 'r' is read-only and
+        'c' is copy-on-write.
+
+    Returns:
+      ReplayBuffer
+    """
+    capacity, h, w, k, size, pos, pr = map(int, np.load(
+        os.path.join(directory, 'meta.npy')))
+    alpha, max_priority, eps = map(float, np.load(
+        os.path.join(directory, 'alpha.npy')))
+    b = cls.__new__(cls)
+    b.capacity, b.height, b.width, b.top_k = capacity, h, w, k
+    b.prioritized, b.alpha, b.eps = bool(pr), alpha, eps
+    b.directory = directory
+    b.size, b.pos, b._max_priority = size, pos, max_priority
+    for name in _FIELDS:
+      f = os.path.join(directory, name + '.npy')
+      setattr(b, name, np.load(f, mmap_mode=mode)
+              if os.path.exists(f) else None)
+    b._tree = None
+    if b.prioritized:
+      b._tree = SumTree(capacity)
+      b._tree.update(np.arange(size),
+                     b.priorities[:size].astype(np.float64) ** alpha)
+    return b
+
+  # Adding positions
+
+  def add(self, boards, players, values, policies=None, priorities=None):
+    """ Add positions, replacing the oldest ones if full
+
+    Args:
+      boards (numpy.array[N][height * width] | [N][height][width]):
+        Boards filled with 0, 1, 2
+      players (numpy.array[N] | int): Side to move
+      values (numpy.array[N]): Value labels for the side to move
+      policies (numpy.array[N][height * width]?): Dense policy targets.
+        Sparse buffers keep top_k of them, renormalized.
+      priorities (numpy.array[N]?): Priorities, raised to eps at least.
+        Default is the maximum priority so far, so new positions are
+        sampled soon.
+
+    Returns:
+      numpy.array(int64)[N]: Slots of the positions
+    """
+    sz = self.height * self.width
+    boards = np.asarray(boards).reshape(-1, sz)
+    n = len(boards)
+    if n > self.capacity:
+      # Only the last ones would survive
+      keep = slice(n - self.capacity, n)
+      boards = boards[keep]
+      players = np.broadcast_to(players, (n,))[keep]
+      values = np.asarray(values)[keep]
+      if policies is not None: policies = np.asarray(policies)[keep]
+      if priorities is not None: priorities = np.asarray(priorities)[keep]
+      n = self.capacity
+    idx = (self.pos + np.arange(n)) % self.capacity
+    self.boards[idx] = boards
+    self.players[idx] = players
+    self.values[idx] = values
+    if self.top_k > 0:
+      if policies is None:
+        self.policy_idx[idx] = 0
+        self.policy_prob[idx] = 0
+      else:
+        p = np.asarray(policies, dtype=np.float64).reshape(n, sz)
+        k = min(self.top_k, sz)
+        top = np.argpartition(-p, k - 1, axis=1)[:, :k]
+        w = np.take_along_axis(p, top, axis=1)
+        s = w.sum(axis=1, keepdims=True)
+        w = np.divide(w, s, out=np.zeros_like(w), where=s > 0)
+        self.policy_idx[idx, :k] = top
+        self.policy_prob[idx, :k] = w
+    else:
+      self.policy[idx] = 0 if policies is None else \
+          np.asarray(policies).reshape(n, sz)
+    if priorities is None:
+      priorities = np.full(n, self._max_priority, dtype=np.float32)
+    else:
+      priorities = np.maximum(
+          np.asarray(priorities, dtype=np.float32), self.eps)
+      self._max_priority = max(self._max_priority, float(priorities.max()))
+    self.priorities[idx] = priorities
+    if self._tree is not None:
+      self._tree.update(idx, priorities.astype(np.float64) ** self.alpha)
+    self.pos = int((self.pos + n) % self.capacity)
+    self.size = min(self.capacity, self.size + n)
+    return idx
+
+  def add_games(self, games, values, policies=None, priorities=None):
+    """ Add current positions of games (see `add`)
+    """
+    sz = self.height * self.width
+    boards = np.frombuffer(b"".join(bytes(g.board) for g in games),
+                           dtype=np.uint8).reshape(-1, sz)
+    players = np.array([g.player for g in games], dtype=np.uint8)
+    return self.add(boards, players, values, policies, priorities)
+
+  def update_priorities(self, index, priorities):
+    """ Update priorities of sampled positions (e.g. by TD errors)
+
+    Priorities smaller than eps are raised to eps.
+    """
+    priorities = np.maximum(np.asarray(priorities, dtype=np.float32),
+                            self.eps)
+    self.priorities[index] = priorities
+    self._max_priority = max(self._max_priority, float(priorities.max()))
+    if self._tree is not None:
+      self._tree.update(index, priorities.astype(np.float64) ** self.alpha)
+
+  # Sampling
+
+  def sample(self, batch_size, rng=None, augment=True, beta=0.4,
+      tensor=False):
+    """ Sample a batch
+
+    Args:
+      batch_size (int): Number of positions
+      rng (numpy.random.Generator?): Random generator
+      augment (bool): Apply a random D4 symmetry to each position
+        (only shape-preserving ones for non-square boards)
+      beta (float): Importance sampling exponent (prioritized only)
+      tensor (bool): Return torch tensors instead of numpy arrays
+
+    Returns:
+      Batch: The batch
+    """
+    if self.size == 0: raise ValueError("Replay buffer is empty")
+    if rng is None: rng = np.random.default_rng()
+    sz = self.height * self.width
+    if self._tree is not None:
+      total = self._tree.total
+      if not total > 0:
+        raise ValueError("Total priority is not positive")
+      mass = (np.arange(batch_size) + rng.random(batch_size)) \
+          * (total / batch_size)
+      index = np.minimum(self._tree.find(mass), self.size - 1)
+      p = self._tree.tree[index + self._tree.size] / total
+      weight = (self.size * np.maximum(p, 1e-12)) ** -beta
+      weight = (weight / weight.max()).astype(np.float32)
+    else:
+      index = rng.integers(0, self.size, batch_size)
+      weight = np.ones(batch_size, dtype=np.float32)
+    boards = self.boards[index]
+    policy = np.zeros((batch_size, sz), dtype=np.float32)
+    if self.top_k > 0:
+      rows = np.arange(batch_size)[:, None]
+      # Padding moves have weight 0, so adding them changes nothing
+      np.add.at(policy, (rows, self.policy_idx[index].astype(np.int64)),
+                self.policy_prob[index].astype(np.float32))
+    else:
+      policy[:] = self.policy[index]
+    if augment:
+      g = symmetry.gather_array(self.height, self.width)
+      t = g[rng.integers(0, len(g), batch_size)]
+      boards = np.take_along_axis(boards, t, axis=1)
+      policy = np.take_along_axis(policy, t, axis=1)
+    pl = self.players[index][:, None]
+    x = np.empty((batch_size, 3, sz), dtype=np.float32)
+    x[:, 0] = boards == 0
+    x[:, 1] = boards == pl
+    x[:, 2] = (boards != 0) & (boards != pl)
+    x = x.reshape(batch_size, 3, self.height, self.width)
+    value = self.values[index].astype(np.float32)
+    if tensor:
+      import torch
+      x, policy = torch.from_numpy(x), torch.from_numpy(policy)
+      value, weight = torch.from_numpy(value), torch.from_numpy(weight)
+    return Batch(x, policy, value, index, weight)
@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""mock5 selfplay
+
+Author: lumiknit (aasr4r4@gmail.com)
+
+Parallel self-play data generation into gen2 records (see `mock5.record`).
+
+Worker processes play games by `simulate` and send finished games, already
+encoded into int pairs, through a bounded queue to the writer (the main
+process). Thus workers wait when the writer falls behind, instead of
+piling games up in memory. The writer appends games to shard files
+`shard-00000.bin`, `shard-00001.bin`, ... in the output directory, and
+moves to a new shard after `shard_games` games.
+
+Games lost by forfeit (an agent returned None or an illegal move) are
+dropped, since a record has no room to mark them, and the winner of such
+a game has no 5-in-a-row (thus `mock5.validate` would report it).
+
+Games are flushed (and fsync-ed) chunk by chunk, so a crash loses at most
+the games not flushed yet. Running it again on the same directory counts
+complete games in the shards, cuts a truncated game off, and plays only
+the remaining games up to the target.
+
+Example:
+  # 100000 games of silly vs silly and silly vs random in 11x11 board
+  python -m mock5.selfplay out 100000 11 11 silly:silly silly:random
+"""
+
+import os
+import time
+
+from mock5 import simulate
+from mock5 import record
+
+# Agent name to module with `agent`
+AGENTS = {
+  "random": "mock5.agent_random",
+  "silly": "mock5.agent_analysis_based",
+  "defensive": "mock5.agent_ad",
+  "df": "mock5.agent_df",
+  "pt": "mock5.agent_pt",
+}
+
+def load_agent(name):
+  """ Agent of a name in AGENTS, or `agent` of a module name
+
+  Workers load agents by name, since functions may not be picklable.
+  """
+  import importlib
+  return importlib.import_module(AGENTS.get(name, name)).agent
+
+def shard_name(i):
+  return "shard-{:05d}.bin".format(i)
+
+def list_shards(directory):
+  """ Shard files in a directory, in order
+
+  Returns:
+    str[]: Paths of shards
+  """
+  if not os.path.isdir(directory): return []
+  names = sorted(x for x in os.listdir(directory)
+                 if x.startswith("shard-") and x.endswith(".bin"))
+  return [os.path.join(directory, x) for x in names]
+
+def worker_seed(seed, start, w):
+  """ Seed of a worker
+
+  It depends on the number of games already played (start),
+  so a resumed run does not repeat games of the previous run.
+  """
+  import numpy as np
+  ss = np.random.SeedSequence(None if seed is None else [seed, start, w])
+  return int(ss.generate_state(1, dtype=np.uint64)[0])
+
+def play_chunks(pairings, first, last, height=15, width=15, chunk=16,
+    seed=0):
+  """ Play games and encode them chunk by chunk
+
+  Game g is played by pairings[(g // chunk) % len(pairings)].
+  Forfeited games are dropped and played again, so it yields exactly
+  last - first games.
+  Random modules (`random` and `numpy.random`) are seeded by seed,
+  since agents use them.
+
+  Args:
+    pairings ((str, str)[]): Names of agents (see `load_agent`)
+    first (int): Index of the first game
+    last (int): Index after the last game
+    height (int): Height of board
+    width (int): Width of board
+    chunk (int): Games played by `simulate` at once
+    seed (int): Random seed
+
+  Yields:
+    numpy.array(int32)[n][2]: Int pairs of games
+    int: Number of games
+    int: Number of moves
+    int: Number of dropped forfeited games
+
+  Raises:
+    RuntimeError: 100 games in a row are forfeited (a broken agent)
+  """
+  import random
+  import numpy as np
+  random.seed(seed)
+  np.random.seed(seed % (1 << 32))
+  agents = {}
+  for pair in pairings:
+    for name in pair:
+      if name not in agents: agents[name] = load_agent(name)
+  g, n_forfeits = first, 0
+  while g < last:
+    n = min(last, (g // chunk + 1) * chunk) - g
+    a1, a2 = pairings[(g // chunk) % len(pairings)]
+    results = simulate(agents[a1], agents[a2], n, height, width, rng=random)
+    for r in results:
+      # A forfeit is an agent call without a move
+      if len(r.latency) == len(r.history): n_forfeits = 0
+      else: n_forfeits += 1
+    if n_forfeits >= 100:
+      raise RuntimeError("{} vs {}: {} games in a row are forfeited"
+                         .format(a1, a2, n_forfeits))
+    results = [r for r in results if len(r.latency) == len(r.history)]
+    if len(results) == 0: continue
+    winners = []
+    for r in results:
+      # Agent index to stone color
+      winners.append(3 - r.winner if r.exchanged and r.winner > 0
+                     else r.winner)
+    histories = [r.history for r in results]
+    yield (record.encode_games(winners, histories), len(results),
+           sum(len(h) for h in histories), n - len(results))
+    g += len(results)
+
+def _worker(queue, args):
+  try:
+    for item in play_chunks(*args):
+      queue.put(item)
+  finally:
+    queue.put(None)
+
+class _Progress:
+  def __init__(self, done, target, interval, verbose):
+    self.done, self.target, self.interval = done, target, interval
+    self.verbose = verbose
+    self.games, self.moves, self.dropped = 0, 0, 0
+    self.start = self.last = time.perf_counter()
+
+  def update(self, games, moves, dropped=0, force=False):
+    self.games += games
+    self.moves += moves
+    self.dropped += dropped
+    if not self.verbose: return
+    t = time.perf_counter()
+    if not force and t - self.last < self.interval: return
+    self.last = t
+    dt = max(t - self.start, 1e-9)
+    print("\r{}/{} games, {:.1f} games/s, {:.1f} moves/s, {} forfeits   "
+          .format(self.done + self.games, self.target, self.games / dt,
+                  self.moves / dt, self.dropped), end="", flush=True)
+
+def selfplay(directory, n_games, height=15, width=15, pairings=None,
+    processes=None, chunk=16, shard_games=100000, queue_size=None,
+    seed=None, fsync=True, interval=1.0, verbose=True):
+  """ Generate self-play records up to n_games
+
+  Args:
+    directory (str): Output directory of shards
+    n_games (int): Target number of games in the directory
+    height (int): Height of board
+    width (int): Width of board
+    pairings ((str, str)[]?): Agent pairs (see `load_agent`) played in
+      turn, chunk by chunk. Default is [("silly", "silly")].
+      Stone colors are randomly chosen for each game.
+    processes (int?): Number of worker processes. Default is cpu count.
+      1 plays games in this process.
+    chunk (int): Games played and flushed at once by a worker
+    shard_games (int): Games of a shard before moving to the next one
+    queue_size (int?): Chunks waiting for the writer, before workers
+      block. Default is 2 * processes.
+    seed (int?): Random seed. Default is fresh entropy.
+    fsync (bool): fsync after each chunk is written
+    interval (float): Seconds between progress reports
+    verbose (bool): Print progress (games/sec and moves/sec)
+
+  Returns:
+    int: Number of games in the directory
+  """
+  if pairings is None: pairings = [("silly", "silly")]
+  if processes is None: processes = os.cpu_count() or 1
+  if queue_size is None: queue_size = 2 * processes
+  os.makedirs(directory, exist_ok=True)
+  # Count games of existing shards, and open the last one
+  shards = list_shards(directory)
+  done = 0
+  for path in shards[:-1]:
+    pairs = record.open_record(path)
+    done += len(record.scan_games(pairs, max_length=height * width)[0])
+    del pairs
+  path = shards[-1] if shards else os.path.join(directory, shard_name(0))
+  n_shards = max(len(shards), 1)
+  writer = record.RecordWriter(path, max_length=height * width, fsync=fsync)
+  done += writer.n_games
+  remaining = max(n_games - done, 0)
+  progress = _Progress(done, n_games, interval, verbose)
+
+  def write(item):
+    nonlocal writer, n_shards
+    pairs, n, moves, dropped = item
+    if writer.n_games >= shard_games:
+      writer.close()
+      writer = record.RecordWriter(
+          os.path.join(directory, shard_name(n_shards)),
+          max_length=height * width, fsync=fsync)
+      n_shards += 1
+    writer.write_pairs(pairs, n)
+    writer.flush()
+    progress.update(n, moves, dropped)
+
+  # Split remaining games into workers
+  processes = max(1, min(processes, -(-remaining // chunk)))
+  tasks = []
+  for w in range(processes):
+    first = done + remaining * w // processes
+    last = done + remaining * (w + 1) // processes
+    tasks.append((pairings, first, last, height, width, chunk,
+                  worker_seed(seed, done, w)))
+  try:
+    if remaining > 0 and processes == 1:
+      for item in play_chunks(*tasks[0]): write(item)
+    elif remaining > 0:
+      import multiprocessing
+      import queue as queue_module
+      q = multiprocessing.Queue(queue_size)
+      workers = [multiprocessing.Process(target=_worker, args=(q, t),
+                                         daemon=True) for t in tasks]
+      for p in workers: p.start()
+      running = len(workers)
+      while running > 0:
+        try:
+          item = q.get(timeout=interval)
+        except queue_module.Empty:
+          if not any(p.is_alive() for p in workers) and q.empty(): break
+          continue
+        if item is None: running -= 1
+        else: write(item)
+      for p in workers: p.join()
+      failed = [p.exitcode for p in workers if p.exitcode != 0]
+      if failed:
+        raise RuntimeError("Worker exited with code {}".format(failed[0]))
+  finally:
+    writer.close()
+    if verbose:
+      progress.update(0, 0, force=True)
+      print()
+  return done + progress.games
+
+if __name__ == "__main__":
+  import sys
+  if len(sys.argv) < 3:
+    print(("Usage: {} <OUT_DIR> <N_GAMES> [<HEIGHT> <WIDTH>] "
+           "[<AGENT1>:<AGENT2>...]").format(sys.argv[0]))
+    print("Agents: {}".format(", ".join(AGENTS)))
+    sys.exit(1)
+  rest = sys.argv[3:]
+  size = [int(a) for a in rest if a.isdigit()]
+  pairings = [tuple(a.split(":", 1)) for a in rest if ":" in a]
+  selfplay(sys.argv[1], int(sys.argv[2]), *size[:2],
+           pairings=pairings or None)
@@ -0,0 +1,350 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""mock5 server
+
+Author: lumiknit (aasr4r4@gmail.com)
+
+asyncio game host, running many Mock5 games in one event loop.
+
+Agents may be plain `agent(game)` functions, or async ones
+(`async def agent(game)`, or any agent returning an awaitable).
+Plain agents run in the event loop unless an executor is given, so heavy
+ones should be used with a (bounded) executor. `GameServer` makes a thread
+pool for a plain agent by default; a process pool suits CPU-bound agents
+better (games and module-level agents are picklable).
+
+`play_async` and `run_games` run games between agents.
+`GameServer` serves games against an agent through a line protocol, over
+TCP or stdin/stdout. Cells are written in the row-col digit notation of
+`Mock5.play` (e.g. '3a' is row 3, column 10).
+
+Protocol (one command per line):
+  Client -> server
+    new [<HEIGHT> <WIDTH>] [black|white]
+      Start a new game. The client plays black by default.
+    move <RC>    Place a stone at RC
+    gg           Give up
+    quit         Close the connection
+  Server -> client
+    ok <HEIGHT> <WIDTH> <black|white>   Game started (client's color)
+    move <RC>                          Server's move
+    end <0|1|2>                        Game finished. 0 is draw,
+                                       1/2 is the winner color
+    error <MESSAGE>                    Wrong command; the game goes on,
+                                       except 'error agent failed', which
+                                       ends the game
+
+Example:
+  # Serve games against agent-analysis-based on port 5555
+  python -m mock5.server 5555
+  # or through stdin/stdout
+  python -m mock5.server -
+"""
+
+import asyncio
+import inspect
+
+from mock5 import Mock5, _digit_to_int, _int_to_digit
+
+#-- Games
+
+async def agent_move(agent, game, executor=None):
+  """ Ask an agent for a move without blocking the event loop
+
+  Args:
+    agent ((Mock5) => (int, int) | Awaitable): Sync or async agent
+    game (Mock5): The game
+    executor (concurrent.futures.Executor?):
+      If it's given, sync agents are run in it.
+
+  Returns:
+    Any: What the agent returns
+  """
+  if executor is not None and not inspect.iscoroutinefunction(agent):
+    loop = asyncio.get_running_loop()
+    ret = await loop.run_in_executor(executor, agent, game)
+  else:
+    ret = agent(game)
+  if inspect.isawaitable(ret): ret = await ret
+  return ret
+
+async def play_async(agent1, agent2, height=15, width=15, rng=None,
+    random_first=True, executor=None):
+  """ Run a game between two (sync or async) agents
+
+  It follows the rules of `mock5.simulate`, and yields to the event loop
+  after every move.
+
+  Returns:
+    mock5.SimulationResult: Result of the game
+  """
+  from array import array
+  from time import perf_counter
+  from mock5 import SimulationResult
+  if rng is None:
+    import random
+    rng = random
+  game = Mock5(height, width)
+  exchanged = bool(random_first and rng.random() < 0.5)
+  if exchanged: agents = (None, agent2, agent1)
+  else: agents = (None, agent1, agent2)
+  latency = array('d')
+  winner = None
+  while winner is None:
+    t = perf_counter()
+    ret = await agent_move(agents[game.player], game, executor)
+    latency.append(perf_counter() - t)
+    idx = _move_index(game, ret)
+    if idx is None:
+      winner = 3 - game.player
+      break
+    game.push(idx)
+    if game.check_win_at(idx) is not None: winner = game.board[idx]
+    elif game.num_legal() == 0: winner = 0
+    await asyncio.sleep(0)
+  if exchanged and winner > 0: winner = 3 - winner
+  return SimulationResult(winner, array('H', game.history), latency,
+                          exchanged)
+
+async def run_games(agent1, agent2, n_games, height=15, width=15,
+    max_concurrency=1000, rng=None, executor=None):
+  """ Run many games concurrently
+
+  Args:
+    max_concurrency (int): Maximum number of games running at once
+
+  Returns:
+    list(mock5.SimulationResult): Result of each game
+  """
+  sem = asyncio.Semaphore(max_concurrency)
+  async def one():
+    async with sem:
+      return await play_async(agent1, agent2, height, width, rng=rng,
+                              executor=executor)
+  return await asyncio.gather(*(one() for _ in range(n_games)))
+
+def _move_index(game, ret):
+  """
+  Index of an agent's move, or None if it gives up or cheats
+  """
+  if ret is None or ret[0] is None or ret[0] is False: return None
+  r, c = int(ret[0]), int(ret[1])
+  if r < 0 or r >= game.height or c < 0 or c >= game.width: return None
+  idx = r * game.width + c
+  if game.board[idx] != 0: return None
+  return idx
+
+def format_cell(game, idx):
+  """ Row-col digits of idx (e.g. '3a')
+  """
+  r, c = game._expand_index(idx)
+  return _int_to_digit(r) + _int_to_digit(c)
+
+def parse_cell(game, s):
+  """ Index of row-col digits (e.g. '3a')
+
+  Returns:
+    int | None: None if s is not a cell of the game's board
+  """
+  if len(s) != 2: return None
+  r, c = _digit_to_int(s, 0), _digit_to_int(s, 1)
+  if r is None or c is None: return None
+  if r >= game.height or c >= game.width: return None
+  return r * game.width + c
+
+#-- Server
+
+class GameServer:
+  """ Line-protocol game server (see the module docstring)
+
+  Attributes:
+    agent ((Mock5) => (int, int) | Awaitable): Server-side agent
+    max_connections (int): Connections over it are refused
+    max_games (int): Games running at once. A new game waits for a free
+      slot, which slows down clients instead of overloading the host.
+    idle_timeout (float?): Seconds to wait for a line before closing
+    line_limit (int): Maximum length of a line in bytes
+    executor (concurrent.futures.Executor?): Executor for sync agents.
+      By default, a thread pool of cpu count workers is made for a sync
+      agent, and shut down by `close`.
+    n_connections (int): Current number of connections
+    n_games (int): Current number of running games
+  """
+  def __init__(self, agent, max_connections=10000, max_games=1000,
+      idle_timeout=600.0, line_limit=256, executor=None):
+    self.agent = agent
+    self.max_connections = max_connections
+    self.max_games = max_games
+    self.idle_timeout = idle_timeout
+    self.line_limit = line_limit
+    self._own_executor = executor is None and \
+        not inspect.iscoroutinefunction(agent)
+    if self._own_executor:
+      import os
+      from concurrent.futures import ThreadPoolExecutor
+      executor = ThreadPoolExecutor(os.cpu_count() or 1)
+    self.executor = executor
+    self.n_connections = 0
+    self.n_games = 0
+    self._slots = None
+
+  def close(self):
+    """ Shut down the executor made by the server
+    """
+    if self._own_executor: self.executor.shutdown(wait=False)
+
+  async def start(self, host='127.0.0.1', port=5555):
+    """ Start serving over TCP
+
+    Returns:
+      asyncio.Server
+    """
+    self._slots = asyncio.Semaphore(self.max_games)
+    return await asyncio.start_server(self.handle, host, port,
+                                      limit=self.line_limit)
+
+  async def serve_stdio(self):
+    """ Serve one session through stdin/stdout
+    """
+    import sys
+    loop = asyncio.get_running_loop()
+    self._slots = asyncio.Semaphore(self.max_games)
+    reader = asyncio.StreamReader(limit=self.line_limit)
+    await loop.connect_read_pipe(
+        lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    transport, protocol = await loop.connect_write_pipe(
+        asyncio.streams.FlowControlMixin, sys.stdout)
+    writer = asyncio.StreamWriter(transport, protocol, reader, loop)
+    await self.handle(reader, writer)
+
+  async def handle(self, reader, writer):
+    """ Run a session on a pair of streams
+    """
+    if self._slots is None: self._slots = asyncio.Semaphore(self.max_games)
+    if self.n_connections >= self.max_connections:
+      await self._send(writer, "error busy")
+      writer.close()
+      return
+    self.n_connections += 1
+    game = None
+    try:
+      while True:
+        try:
+          line = await asyncio.wait_for(reader.readline(), self.idle_timeout)
+        except (asyncio.TimeoutError, ValueError):
+          break
+        if not line: break
+        cmd = line.decode('ascii', 'replace').split()
+        if len(cmd) == 0: continue
+        if cmd[0] == 'quit': break
+        elif cmd[0] == 'new':
+          if game is not None: self._end_game()
+          game = None
+          game = await self._new_game(writer, cmd[1:])
+        elif game is None:
+          await self._send(writer, "error no game")
+        elif cmd[0] == 'gg':
+          await self._send(writer, "end {}".format(3 - game.player))
+          self._end_game()
+          game = None
+        elif cmd[0] == 'move' and len(cmd) == 2:
+          if not await self._move(writer, game, cmd[1]):
+            self._end_game()
+            game = None
+        else:
+          await self._send(writer, "error unknown command")
+    except ConnectionError:
+      pass
+    finally:
+      if game is not None: self._end_game()
+      self.n_connections -= 1
+      writer.close()
+
+  async def _send(self, writer, line):
+    writer.write((line + "\n").encode('ascii'))
+    # Backpressure: wait until the client reads
+    await writer.drain()
+
+  async def _new_game(self, writer, args):
+    try:
+      h, w = (int(args[0]), int(args[1])) if len(args) >= 2 else (15, 15)
+      color = args[-1] if len(args) in (1, 3) else 'black'
+      if color not in ('black', 'white'): raise ValueError
+      game = Mock5(h, w)
+    except Exception:
+      await self._send(writer, "error wrong new")
+      return None
+    await self._slots.acquire()
+    self.n_games += 1
+    try:
+      await self._send(writer, "ok {} {} {}".format(h, w, color))
+      if color == 'white' and not await self._agent_turn(writer, game):
+        self._end_game()
+        return None
+    except BaseException:
+      # The caller does not own the slot yet
+      self._end_game()
+      raise
+    return game
+
+  def _end_game(self):
+    self.n_games -= 1
+    self._slots.release()
+
+  async def _move(self, writer, game, cell):
+    """
+    Place client's move and answer. Return False if the game is finished.
+    """
+    idx = parse_cell(game, cell)
+    if idx is None or game.board[idx] != 0:
+      await self._send(writer, "error cannot place at {}".format(cell))
+      return True
+    game.push(idx)
+    if game.check_win_at(idx) is not None:
+      await self._send(writer, "end {}".format(game.board[idx]))
+      return False
+    if game.num_legal() == 0:
+      await self._send(writer, "end 0")
+      return False
+    return await self._agent_turn(writer, game)
+
+  async def _agent_turn(self, writer, game):
+    """
+    Play server's move. Return False if the game is finished.
+    """
+    try:
+      ret = await agent_move(self.agent, game, self.executor)
+    except Exception as e:
+      await self._send(writer, "error agent failed ({})"
+                       .format(type(e).__name__))
+      return False
+    idx = _move_index(game, ret)
+    if idx is None:
+      await self._send(writer, "end {}".format(3 - game.player))
+      return False
+    game.push(idx)
+    await self._send(writer, "move {}".format(format_cell(game, idx)))
+    if game.check_win_at(idx) is not None:
+      await self._send(writer, "end {}".format(game.board[idx]))
+      return False
+    if game.num_legal() == 0:
+      await self._send(writer, "end 0")
+      return False
+    return True
+
+if __name__ == "__main__":
+  import os
+  import sys
+  from concurrent.futures import ProcessPoolExecutor
+  import mock5.agent_analysis_based
+  # The agent is CPU-bound, thus processes run moves of sessions in parallel
+  server = GameServer(mock5.agent_analysis_based.agent,
+                      executor=ProcessPoolExecutor(os.cpu_count() or 1))
+  if len(sys.argv) >= 2 and sys.argv[1] == '-':
+    asyncio.run(server.serve_stdio())
+  else:
+    port = int(sys.argv[1]) if len(sys.argv) >= 2 else 5555
+    async def main():
+      s = await server.start(port=port)
+      async with s: await s.serve_forever()
+    asyncio.run(main())
@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""mock5 shm
+
+Author: lumiknit (aasr4r4@gmail.com)
+
+Shared-memory board pool for multi-process self-play.
+
+Self-play workers write positions (board, side to move, result) straight
+into preallocated slots of a shared memory block, and the trainer reads
+them as numpy views. Nothing is pickled or sent through pipes.
+
+The pool is split into one ring per writer. Each ring has one producer
+(its worker) and one consumer (the trainer), tracked by two sequence
+numbers: head (slots written so far, advanced only by the writer) and
+tail (slots consumed so far, advanced only by the reader). A slot is
+published by advancing head after its contents are written, and given
+back by advancing tail, so the hot path needs no locks (see `BoardPool`
+for the platforms it supports).
+
+Example:
+  # Trainer
+  pool = BoardPool.create(4096, 15, 15, n_writers=8)
+  # ... start workers with pool.name and their writer index w
+  for w in range(pool.n_writers):
+    boards, players, plies, results = pool.peek(w) # Views, no copy
+    train(boards, players, plies, results)
+    pool.release(w, len(boards))
+  pool.close(); pool.unlink()
+
+  # Worker w
+  pool = BoardPool.attach(name)
+  while not pool.put(w, game, result): time.sleep(0.001) # Ring is full
+"""
+
+import numpy as np
+from multiprocessing import shared_memory
+
+MAGIC = 0x4c4f4f5035434f4d # 'MOC5POOL'
+VERSION = 1
+
+# Counters are 64 bytes apart, not to share a cache line
+_COUNTER_STRIDE = 8
+
+def _attach(name):
+  """
+  Open an existing shared memory, which is not unlinked at exit of this
+  process (only the creator unlinks it)
+  """
+  try:
+    return shared_memory.SharedMemory(name=name, track=False)
+  except TypeError:
+    # Before Python 3.13, attaching registers it to the resource tracker
+    shm = shared_memory.SharedMemory(name=name)
+    from multiprocessing import resource_tracker
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+class BoardPool:
+  """ Rings of board slots in shared memory
+
+  Use `BoardPool.create` in the trainer and `BoardPool.attach` in workers.
+  A pool can also be pickled (e.g. as an argument of a process), which
+  attaches to the same memory in the other process.
+
+  Rings have no memory barrier, since Python has none. They rely on
+  stores of one process being seen by others in the same order, and on
+  8-byte aligned counters being written atomically. It holds for x86-64
+  (total store order), but not for weakly ordered CPUs such as ARM or
+  POWER, where a reader may see an advanced head before the slot is
+  written. Do not use it on those platforms.
+
+  Attributes:
+    name (str): Name of the shared memory
+    n_slots (int): Number of slots of all rings
+    height (int): Height of board
+    width (int): Width of board
+    n_writers (int): Number of rings, one for each writer
+    ring_size (int): Slots of a ring. Slots of writer w are
+      [w * ring_size, (w + 1) * ring_size).
+    boards (numpy.array(uint8)[n_slots][height][width]):
+      Boards filled with 0, 1, 2
+    players (numpy.array(uint8)[n_slots]): Side to move of each board
+    plies (numpy.array(uint16)[n_slots]): Number of stones of each board
+    results (numpy.array(float32)[n_slots]): Result of each board
+      (e.g. final outcome for the side to move)
+  """
+  def __init__(self, shm, owner=False):
+    self._shm = shm
+    self._owner = owner
+    header = np.ndarray((8,), dtype='<i8', buffer=shm.buf)
+    if header[0] != MAGIC or header[1] != VERSION:
+      raise ValueError("{} is not a board pool".format(shm.name))
+    _, _, n, h, w, k, _, _ = map(int, header)
+    self.n_slots, self.height, self.width, self.n_writers = n, h, w, k
+    self.ring_size = n // k
+    off = header.nbytes
+    def take(shape, dtype):
+      nonlocal off
+      dtype = np.dtype(dtype)
+      off = (off + 63) // 64 * 64
+      a = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=off)
+      off += a.nbytes
+      return a
+    self._heads = take((k, _COUNTER_STRIDE), '<u8')
+    self._tails = take((k, _COUNTER_STRIDE), '<u8')
+    self.boards = take((n, h, w), np.uint8)
+    self.players = take((n,), np.uint8)
+    self.plies = take((n,), '<u2')
+    self.results = take((n,), '<f4')
+    self._flat = self.boards.reshape(n, h * w)
+
+  @staticmethod
+  def _size(n_slots, height, width, n_writers):
+    sz = 64 + 2 * 64 * n_writers
+    sz += n_slots * (height * width + 1 + 2 + 4) + 4 * 64
+    return sz
+
+  @classmethod
+  def create(cls, n_slots, height, width, n_writers=1, name=None):
+    """ Create a pool
+
+    Args:
+      n_slots (int): Number of slots. It's rounded down to a multiple of
+        n_writers.
+      height (int): Height of board
+      width (int): Width of board
+      n_writers (int): Number of writer processes
+      name (str?): Name of the shared memory. Default is a random name.
+
+    Returns:
+      BoardPool: The pool. Call `close` and `unlink` after use.
+    """
+    n_slots = n_slots // n_writers * n_writers
+    if n_slots <= 0: raise ValueError("Too few slots for writers")
+    shm = shared_memory.SharedMemory(
+        name=name, create=True,
+        size=cls._size(n_slots, height, width, n_writers))
+    header = np.ndarray((8,), dtype='<i8', buffer=shm.buf)
+    header[:] = [MAGIC, VERSION, n_slots, height, width, n_writers, 0, 0]
+    pool = cls(shm, owner=True)
+    pool._heads[:] = 0
+    pool._tails[:] = 0
+    return pool
+
+  @classmethod
+  def attach(cls, name):
+    """ Attach to a pool created by another process
+    """
+    return cls(_attach(name))
+
+  @property
+  def name(self):
+    return self._shm.name
+
+  def __reduce__(self):
+    return (self.__class__.attach, (self.name,))
+
+  def close(self):
+    """ Detach from the shared memory. Views must not be used after it.
+    """
+    self._heads = self._tails = None
+    self.boards = self.players = self.plies = self.results = None
+    self._flat = None
+    self._shm.close()
+
+  def unlink(self):
+    """ Remove the shared memory (by the creator, after all closed it)
+    """
+    self._shm.unlink()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+    if self._owner: self.unlink()
+
+  # Writer side
+
+  def free(self, w):
+    """ Number of free slots in the ring of writer w
+    """
+    return self.ring_size - int(self._heads[w, 0]) + int(self._tails[w, 0])
+
+  def put(self, w, game, result=0.0):
+    """ Write a position into the ring of writer w
+
+    Only one process may write into each ring.
+
+    Args:
+      w (int): Writer index
+      game (Mock5): The game. Its size should be the same as pool's.
+      result (float): Result of the position
+
+    Returns:
+      bool: False if the ring is full (nothing is written)
+    """
+    return self.put_board(w, game.board, game.player, len(game.history),
+                          result)
+
+  def put_board(self, w, board, player, ply=0, result=0.0):
+    """ Write a board (int[height * width] or bytes) into the ring of w
+
+    Returns:
+      bool: False if the ring is full (nothing is written)
+    """
+    head = int(self._heads[w, 0])
+    if head - int(self._tails[w, 0]) >= self.ring_size: return False
+    i = w * self.ring_size + head % self.ring_size
+    self._flat[i] = np.frombuffer(bytes(board), dtype=np.uint8)
+    self.players[i] = player
+    self.plies[i] = ply
+    self.results[i] = result
+    # Publish after the slot is written
+    self._heads[w, 0] = head + 1
+    return True
+
+  # Reader side
+
+  def available(self, w):
+    """ Number of written slots not released yet in the ring of writer w
+    """
+    return int(self._heads[w, 0]) - int(self._tails[w, 0])
+
+  def peek(self, w, max_n=None):
+    """ Views of written slots of writer w, the oldest first
+
+    Slots stay owned by the reader until `release`, so the views are
+    valid until then. At most one contiguous run of slots is returned,
+    so call again after release to get slots wrapped around the ring.
+
+    Returns:
+      numpy.array(uint8)[n][height][width]: Boards
+      numpy.array(uint8)[n]: Side to move
+      numpy.array(uint16)[n]: Number of stones
+      numpy.array(float32)[n]: Results
+    """
+    tail = int(self._tails[w, 0])
+    n = int(self._heads[w, 0]) - tail
+    start = tail % self.ring_size
+    n = min(n, self.ring_size - start)
+    if max_n is not None: n = min(n, max_n)
+    s = slice(w * self.ring_size + start, w * self.ring_size + start + n)
+    return self.boards[s], self.players[s], self.plies[s], self.results[s]
+
+  def release(self, w, n):
+    """ Give n oldest slots of writer w back to the writer
+    """
+    if n > self.available(w): raise ValueError("Releasing unwritten slots")
+    self._tails[w, 0] = int(self._tails[w, 0]) + n
+
+  def drain(self):
+    """ Copy all written slots of all writers and release them
+
+    Returns:
+      numpy.array(uint8)[n][height][width]: Boards
+      numpy.array(uint8)[n]: Side to move
+      numpy.array(uint16)[n]: Number of stones
+      numpy.array(float32)[n]: Results
+    """
+    parts = []
+    for w in range(self.n_writers):
+      while True:
+        views = self.peek(w)
+        if len(views[0]) == 0: break
+        parts.append([v.copy() for v in views])
+        self.release(w, len(views[0]))
+    if len(parts) == 0:
+      return (np.zeros((0, self.height, self.width), np.uint8),
+              np.zeros(0, np.uint8), np.zeros(0, '<u2'),
+              np.zeros(0, np.float32))
+    return tuple(np.concatenate(x) for x in zip(*parts))
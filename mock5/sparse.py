@@ -0,0 +1,424 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""mock5 sparse
+
+Author: lumiknit (aasr4r4@gmail.com)
+
+Sparse board for large or unbounded (free-style) boards.
+
+`Mock5` keeps a dense list of cells and at most 36x36 boards, because a
+row/column is written as a single digit. `SparseMock5` keeps only stones
+in a dict keyed by (row, col), so memory and the cost of a move grow with
+the number of stones, not with the board area. Height and width may be
+None for an unbounded axis, and then coordinates may be negative.
+
+Coordinates are written as 'ROW,COL' in decimal (e.g. '120,-3'),
+see `format_coord` and `parse_coord`.
+
+Example:
+  from mock5.sparse import SparseMock5, crop_agent
+  import mock5.agent_analysis_based
+  g = SparseMock5() # Infinite board
+  g.place_stone(0, 0)
+  agent = crop_agent(mock5.agent_analysis_based.agent)
+  r, c = agent(g) # Play with a Mock5 agent on the area around stones
+  g.place_stone(r, c)
+  x, (r0, c0) = g.numpy(margin=2) # Encoding of the area around stones
+"""
+
+from mock5 import Mock5
+
+#-- Notation
+
+def format_coord(r, c):
+  """ Write (row, col) as 'ROW,COL'
+  """
+  return "{},{}".format(r, c)
+
+def parse_coord(s):
+  """ Read 'ROW,COL' (or 'ROW COL')
+
+  Returns:
+    (int, int) | None: None if s is not a coordinate
+  """
+  t = s.replace(',', ' ').split()
+  if len(t) != 2: return None
+  try:
+    return (int(t[0]), int(t[1]))
+  except ValueError:
+    return None
+
+#-- Sparse game class
+
+class SparseMock5:
+  """ Omok Game on a Sparse Board
+
+  Methods follow `Mock5`, but cells are (row, col) pairs, not indices.
+
+  Attributes:
+    height (int?): Height of board. None is unbounded.
+    width (int?): Width of board. None is unbounded.
+    stones (dict((int, int) => 1 | 2)): Stones on board
+    history ((int, int)[]): Stone placing history
+    player (1 | 2): Index of player who should place stone now
+  """
+
+  __slots__ = ('height', 'width', 'stones', 'history', 'player')
+
+  def __init__(self, height=None, width=None, history=None):
+    """ Constructor
+
+    Args:
+      height (int?): Height of board. Default is unbounded.
+      width (int?): Width of board. Default is unbounded.
+      history ((int, int)[]?):
+        If it's not None, it'll put stones following history.
+    """
+    for v in (height, width):
+      if v is not None and (type(v) is not int or v <= 0):
+        raise ValueError("Board size should be a positive int or None")
+    self.height = height
+    self.width = width
+    self.stones = {}
+    self.history = []
+    self.player = 1
+    if history is not None:
+      for r, c in history:
+        if not self.place_stone(r, c):
+          raise ValueError("Cannot place a stone at {}"
+                           .format(format_coord(r, c)))
+
+  @classmethod
+  def from_mock5(cls, game):
+    """ Make a sparse game of the same size and history as a Mock5
+    """
+    return cls(game.height, game.width,
+               history=[game._expand_index(i) for i in game.history])
+
+  def __str__(self):
+    """ ToString
+
+    Print the area around stones (see `window`), with row/col labels
+    """
+    r0, c0, h, w = self.window(margin=1)
+    lw = max(len(str(r0)), len(str(r0 + h - 1)))
+    cw = max(len(str(c0)), len(str(c0 + w - 1)))
+    r = "====================================="
+    r += "\n [ Turn {:3d} ; {}P's turn ]".format(len(self.history), self.player)
+    r += "\n" + " " * lw + " |"
+    for j in range(w): r += " {:>{}}".format(c0 + j, cw)
+    r += "\n" + "-" * lw + "-+" + "-" * ((cw + 1) * w)
+    for i in range(h):
+      r += "\n{:>{}} |".format(r0 + i, lw)
+      for j in range(w):
+        r += " {:>{}}".format(".OX"[self.stones.get((r0 + i, c0 + j), 0)], cw)
+    return r
+
+  # Indexing
+
+  def in_board(self, r, c):
+    """ Check (r, c) is in the board
+    """
+    return (self.height is None or 0 <= r < self.height) and \
+        (self.width is None or 0 <= c < self.width)
+
+  def __getitem__(self, key):
+    """ Index
+
+    Args:
+      key ((int, int)): (row, column) pair
+
+    Returns:
+      0|1|2: Cell of board at (row, column)
+
+    Raises:
+      IndexError: (row, column) is out of board
+    """
+    if not self.in_board(key[0], key[1]): raise IndexError
+    return self.stones.get((key[0], key[1]), 0)
+
+  def num_stones(self):
+    """ Number of stones on board
+    """
+    return len(self.stones)
+
+  def is_full(self):
+    """ True iff a bounded board has no empty cell
+    """
+    return self.height is not None and self.width is not None and \
+        len(self.stones) == self.height * self.width
+
+  # Placing stone methods
+
+  def can_place_at(self, r, c):
+    """ Check the current player's stone can be placed at (r, c)
+    """
+    if (type(r) is not int) or (type(c) is not int): raise TypeError
+    return self.in_board(r, c) and (r, c) not in self.stones
+
+  def place_stone(self, r, c):
+    """ Place a Stone at
+
+    Place the current player's stone at r row c column, and pass the turn.
+
+    Returns:
+      bool: True iff a stone is placed without violating any rules.
+    """
+    if not self.can_place_at(r, c): return False
+    self.push(r, c)
+    return True
+
+  def push(self, r, c):
+    """ Place a Stone without Validation (see `Mock5.push`)
+    """
+    self.stones[(r, c)] = self.player
+    self.history.append((r, c))
+    self.player = 3 - self.player
+
+  def pop(self):
+    """ Undo without Validation (see `Mock5.pop`)
+
+    Returns:
+      (int, int): The removed stone
+    """
+    rc = self.history.pop()
+    del self.stones[rc]
+    self.player = 3 - self.player
+    return rc
+
+  def undo(self):
+    """ Undo
+
+    Take the last move back. If no stones have benn placed, it'll do nothing.
+
+    Returns:
+      int: New length of history of this game
+    """
+    if len(self.history) > 0: self.pop()
+    return len(self.history)
+
+  def check_win_at(self, r, c):
+    """ Check the Stone at (r, c) Makes 5 in a Row
+
+    Returns:
+      None | int: Color of the stone at (r, c) if it makes 5 (or more)
+        stones in a row, otherwise None
+    """
+    s = self.stones
+    p = s.get((r, c), 0)
+    if p == 0: return None
+    for dr, dc in ((0, 1), (1, 0), (1, 1), (1, -1)):
+      cnt = 1
+      rr, cc = r + dr, c + dc
+      while s.get((rr, cc)) == p:
+        cnt += 1
+        rr, cc = rr + dr, cc + dc
+      rr, cc = r - dr, c - dc
+      while s.get((rr, cc)) == p:
+        cnt += 1
+        rr, cc = rr - dr, cc - dc
+      if cnt >= 5: return p
+    return None
+
+  # Area around stones
+
+  def bounding_box(self):
+    """ Bounding box of stones
+
+    Returns:
+      (int, int, int, int) | None: (min row, min col, max row, max col),
+        or None if there is no stone
+    """
+    if len(self.stones) == 0: return None
+    rs = [r for r, _ in self.stones]
+    cs = [c for _, c in self.stones]
+    return (min(rs), min(cs), max(rs), max(cs))
+
+  def window(self, margin=2):
+    """ Area around stones, clipped by the board
+
+    Args:
+      margin (int): Empty cells added on each side of the bounding box
+
+    Returns:
+      (int, int, int, int): (top row, left col, height, width)
+    """
+    bb = self.bounding_box()
+    if bb is None:
+      # Around the center (or the origin of an unbounded axis)
+      cr = 0 if self.height is None else self.height // 2
+      cc = 0 if self.width is None else self.width // 2
+      bb = (cr, cc, cr, cc)
+    r0, c0, r1, c1 = bb[0] - margin, bb[1] - margin, \
+        bb[2] + margin, bb[3] + margin
+    if self.height is not None: r0, r1 = max(r0, 0), min(r1, self.height - 1)
+    if self.width is not None: c0, c1 = max(c0, 0), min(c1, self.width - 1)
+    return (r0, c0, r1 - r0 + 1, c1 - c0 + 1)
+
+  def numpy(self, player=None, one_hot_encoding=True, margin=2, dtype=None):
+    """ numpy.array Conversion of the area around stones
+
+    Same as `Mock5.numpy()` (rank=3 or 2) of the board cropped by `window`.
+
+    Args:
+      player (int?): 1 or 2. Default value is current player.
+      one_hot_encoding (bool): See `Mock5.numpy()`
+      margin (int): See `window`
+      dtype (numpy.dtype): Default is numpy.float64 for one hot encoding,
+        otherwise numpy.int64
+
+    Returns:
+      numpy.array(dtype=dtype): [3][h][w] if one_hot_encoding,
+        otherwise [h][w] filled with 0, 1 (player's), 2 (opponent's)
+      (int, int): (row, col) of [0][0] of the result on the board
+    """
+    import numpy as np
+    if player is None: player = self.player
+    r0, c0, h, w = self.window(margin)
+    bd = np.zeros((h, w), dtype=np.uint8)
+    if len(self.stones) > 0:
+      rc = np.array(list(self.stones.keys()), dtype=np.int64)
+      v = np.fromiter(self.stones.values(), dtype=np.uint8,
+                      count=len(self.stones))
+      bd[rc[:, 0] - r0, rc[:, 1] - c0] = v
+    if one_hot_encoding:
+      if dtype is None: dtype = np.float64
+      a = np.empty((3, h, w), dtype=dtype)
+      a[0] = bd == 0
+      a[1] = bd == player
+      a[2] = bd == 3 - player
+    else:
+      if dtype is None: dtype = np.int64
+      a = np.zeros((h, w), dtype=dtype)
+      a[bd == player] = 1
+      a[bd == 3 - player] = 2
+    return a, (r0, c0)
+
+  def tensor(self, player=None, one_hot_encoding=True, margin=2, dtype=None):
+    """ torch.tensor Conversion of the area around stones
+
+    See `numpy()`. dtype is a torch.dtype, default is torch.float for
+    one hot encoding.
+
+    Returns:
+      torch.tensor(dtype=dtype): See `numpy()`
+      (int, int): (row, col) of [0][0] of the result on the board
+    """
+    import torch
+    a, origin = self.numpy(player, one_hot_encoding, margin)
+    t = torch.from_numpy(a)
+    if dtype is None and one_hot_encoding: dtype = torch.float
+    if dtype is not None: t = t.to(dtype)
+    return t, origin
+
+  def crop(self, margin=2):
+    """ Mock5 of the area around stones
+
+    Stones in the crop are in the same order as history,
+    so Mock5 agents can play on it.
+
+    Returns:
+      Mock5: The cropped game
+      (int, int): (row, col) of (0, 0) of the crop on the board
+
+    Raises:
+      ValueError: The area is larger than Mock5 allows (36x36)
+    """
+    r0, c0, h, w = self.window(margin)
+    if h > 36 or w > 36:
+      raise ValueError("Area around stones is larger than 36x36")
+    return self.crop_window(r0, c0, h, w), (r0, c0)
+
+  def window_around(self, r, c, size=36):
+    """ Area of size x size centered at (r, c), clipped by the board
+
+    Returns:
+      (int, int, int, int): (top row, left col, height, width)
+    """
+    def axis(x, n):
+      lo = x - size // 2
+      if n is None: return lo, size
+      if n <= size: return 0, n
+      return min(max(lo, 0), n - size), size
+    r0, h = axis(r, self.height)
+    c0, w = axis(c, self.width)
+    return (r0, c0, h, w)
+
+  def crop_window(self, r0, c0, h, w):
+    """ Mock5 of an area
+
+    Stones out of the area are dropped, and the player to move is the
+    same. Then colors in the history of the area may not alternate, so
+    the history of the crop is its longest suffix whose colors alternate
+    (ending with the opponent of the player to move). Other stones are on
+    the board but not in the history; `undo` stops before them.
+
+    Returns:
+      Mock5: The cropped game
+
+    Raises:
+      ValueError: h or w is not in 1~36
+    """
+    if not (1 <= h <= 36 and 1 <= w <= 36):
+      raise ValueError("Crop size should be between 1 and 36")
+    board = [0] * (h * w)
+    kept = []
+    for r, c in self.history:
+      if r0 <= r < r0 + h and c0 <= c < c0 + w:
+        i = (r - r0) * w + (c - c0)
+        board[i] = self.stones[(r, c)]
+        kept.append(i)
+    n, color = 0, 3 - self.player
+    for i in reversed(kept):
+      if board[i] != color: break
+      n, color = n + 1, 3 - color
+    history = kept[len(kept) - n:]
+    return Mock5._from_state(h, w, board, history, self.player)
+
+  def nearest_empty(self, r, c):
+    """ Empty cell nearest to (r, c) in Chebyshev distance
+
+    Returns:
+      (int, int) | None: The cell, or None if the board is full
+    """
+    if self.is_full(): return None
+    d = 0
+    while True:
+      for dr in range(-d, d + 1):
+        step = 1 if abs(dr) == d else 2 * d
+        for dc in range(-d, d + 1, max(step, 1)):
+          rc = (r + dr, c + dc)
+          if self.in_board(*rc) and rc not in self.stones: return rc
+      d += 1
+
+def crop_agent(agent, margin=2):
+  """ Play a Mock5 agent on the area around stones of a SparseMock5
+
+  When stones spread over more than 36x36 cells (see `SparseMock5.crop`),
+  the agent plays on the 36x36 area around the last move instead
+  (see `SparseMock5.window_around` and `crop_window`), and stones out of
+  it are unseen. If that area is full, the area around the empty cell
+  nearest to the last move is used.
+
+  Args:
+    agent ((Mock5) => (int, int)): Mock5 agent
+    margin (int): See `SparseMock5.window`
+
+  Returns:
+    (SparseMock5) => (int, int): Agent for SparseMock5
+  """
+  def player(game):
+    r0, c0, h, w = game.window(margin)
+    if h > 36 or w > 36:
+      r, c = game.history[-1]
+      r0, c0, h, w = game.window_around(r, c)
+      if all((r0 + i, c0 + j) in game.stones
+             for i in range(h) for j in range(w)):
+        rc = game.nearest_empty(r, c)
+        if rc is not None: r0, c0, h, w = game.window_around(*rc)
+    g = game.crop_window(r0, c0, h, w)
+    ret = agent(g)
+    if ret is None or ret[0] is None or ret[0] is False: return ret
+    return (ret[0] + r0, ret[1] + c0)
+  player.name = getattr(agent, "name", "agent")
+  return player
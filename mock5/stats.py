@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""mock5 stats
+
+Author: lumiknit (aasr4r4@gmail.com)
+
+Streaming statistics over gen2 record corpora (see `mock5.record`).
+
+Record files are memory-mapped and decoded chunk by chunk with numpy,
+shards are processed over processes, and partial results are merged.
+Thus the corpus need not to fit in RAM.
+
+Collected statistics (see `CorpusStats`):
+  * Move heatmaps and occupancy heatmaps by ply
+  * Game length histogram and outcome counts
+  * Win counts of openings, canonicalized over D4 symmetries
+
+Example:
+  # Write CSV files of 15x15 records into stats/
+  python -m mock5.stats stats 15 15 out1 out2
+"""
+
+import os
+import numpy as np
+
+from mock5 import record, symmetry, _int_to_digit
+
+class CorpusStats:
+  """ Statistics of a record corpus
+
+  Attributes:
+    height (int): Height of board
+    width (int): Width of board
+    max_ply (int): Number of plies tracked by heatmaps
+    opening_plies (int): Number of moves in an opening
+    moves (int64[max_ply][height * width]):
+      moves[p, i] = number of p-th (0-based) moves placed at cell i
+    occupancy (int64[max_ply][height * width]):
+      occupancy[p, i] = number of positions after the p-th move
+      where cell i is occupied
+    reached (int64[max_ply]): reached[p] = number of games with p-th move.
+      Divide heatmaps by it to get frequencies.
+    lengths (int64[height * width + 1]): Histogram of game lengths
+    outcomes (int64[3]): Number of draws, black wins and white wins
+    opening_keys (int64[n]): Sorted keys of canonical openings
+      (see `opening_moves`)
+    opening_counts (int64[n][3]): Draws, black wins and white wins
+      for each opening
+  """
+  def __init__(self, height, width, max_ply=None, opening_plies=3):
+    sz = height * width
+    if max_ply is None: max_ply = sz
+    if (sz + 1) ** opening_plies >= 2 ** 63:
+      raise ValueError("Too many opening plies for the board size")
+    self.height = height
+    self.width = width
+    self.max_ply = max_ply
+    self.opening_plies = opening_plies
+    self.moves = np.zeros((max_ply, sz), dtype=np.int64)
+    self.occupancy = np.zeros((max_ply, sz), dtype=np.int64)
+    self.reached = np.zeros(max_ply, dtype=np.int64)
+    self.lengths = np.zeros(sz + 1, dtype=np.int64)
+    self.outcomes = np.zeros(3, dtype=np.int64)
+    self.opening_keys = np.zeros(0, dtype=np.int64)
+    self.opening_counts = np.zeros((0, 3), dtype=np.int64)
+
+  @property
+  def n_games(self):
+    return int(self.outcomes.sum())
+
+  def add_games(self, pairs, heads):
+    """ Accumulate statistics of games
+
+    Args:
+      pairs (numpy.array[n][2]): Int pairs (see `record.open_record`)
+      heads (numpy.array(int64)[G]): Header indices (see `record.scan_games`)
+    """
+    sz = self.height * self.width
+    mp = self.max_ply
+    heads = np.asarray(heads, dtype=np.int64)
+    winners = np.clip(pairs[heads, 0], 0, 2).astype(np.int64)
+    lengths = pairs[heads, 1].astype(np.int64)
+    self.lengths += np.bincount(lengths, minlength=sz + 1)[:sz + 1]
+    self.outcomes += np.bincount(winners, minlength=3)
+    self.reached += np.bincount(
+        np.minimum(lengths, mp), minlength=mp + 1)[::-1].cumsum()[::-1][1:]
+    idx, game, ply = record.game_moves(pairs, heads)
+    # Heatmaps; a move stays on board from its ply to the end of game
+    t = ply < mp
+    self.moves += np.bincount(
+        ply[t] * sz + idx[t], minlength=mp * sz).reshape(mp, sz)
+    end = np.minimum(lengths[game[t]], mp)
+    diff = np.bincount(ply[t] * sz + idx[t], minlength=(mp + 1) * sz)
+    diff -= np.bincount(end * sz + idx[t], minlength=(mp + 1) * sz)
+    self.occupancy += diff.reshape(mp + 1, sz)[:mp].cumsum(axis=0)
+    # Openings
+    k = self.opening_plies
+    if k > 0:
+      op = np.full((len(heads), k), sz, dtype=np.int64)
+      o = ply < k
+      op[game[o], ply[o]] = idx[o]
+      keys = self._canonical_opening_keys(op)
+      u, inv = np.unique(keys, return_inverse=True)
+      c = np.zeros((len(u), 3), dtype=np.int64)
+      np.add.at(c, (inv.reshape(-1), winners), 1)
+      self._merge_openings(u, c)
+
+  def _canonical_opening_keys(self, op):
+    sz = self.height * self.width
+    f = np.concatenate(
+        [symmetry.forward_array(self.height, self.width),
+         np.full((len(symmetry.symmetries(self.height, self.width)), 1), sz)],
+        axis=1)
+    variants = f[:, op] # [s][G][k], padding sz is mapped to itself
+    best = symmetry.lexmin(variants)
+    canon = variants[best, np.arange(len(best))]
+    w = (sz + 1) ** np.arange(self.opening_plies - 1, -1, -1, dtype=np.int64)
+    return canon @ w
+
+  def _merge_openings(self, keys, counts):
+    keys = np.concatenate([self.opening_keys, keys])
+    counts = np.concatenate([self.opening_counts, counts])
+    u, inv = np.unique(keys, return_inverse=True)
+    c = np.zeros((len(u), 3), dtype=np.int64)
+    np.add.at(c, inv.reshape(-1), counts)
+    self.opening_keys, self.opening_counts = u, c
+
+  def merge(self, other):
+    """ Merge statistics of another corpus of the same settings
+    """
+    if (self.height, self.width, self.max_ply, self.opening_plies) != \
+        (other.height, other.width, other.max_ply, other.opening_plies):
+      raise ValueError("Cannot merge statistics of different settings")
+    self.moves += other.moves
+    self.occupancy += other.occupancy
+    self.reached += other.reached
+    self.lengths += other.lengths
+    self.outcomes += other.outcomes
+    self._merge_openings(other.opening_keys, other.opening_counts)
+    return self
+
+  def opening_moves(self, keys=None):
+    """ Decode opening keys
+
+    Returns:
+      int64[n][opening_plies]: Board indices of moves.
+        height * width is filled after the end of a short game.
+    """
+    if keys is None: keys = self.opening_keys
+    sz = self.height * self.width
+    k = self.opening_plies
+    w = (sz + 1) ** np.arange(k - 1, -1, -1, dtype=np.int64)
+    return (np.asarray(keys)[:, None] // w) % (sz + 1)
+
+  def opening_table(self, min_games=1):
+    """ Win rates of openings, most played first
+
+    Returns:
+      int64[n][opening_plies]: Moves of each opening (see `opening_moves`)
+      int64[n][3]: Draws, black wins and white wins
+      float64[n]: Black win rate (draw counts as half)
+    """
+    c = self.opening_counts
+    games = c.sum(axis=1)
+    order = np.argsort(-games, kind='stable')
+    order = order[games[order] >= min_games]
+    c = c[order]
+    rate = (c[:, 1] + 0.5 * c[:, 0]) / np.maximum(c.sum(axis=1), 1)
+    return self.opening_moves(self.opening_keys[order]), c, rate
+
+  def save(self, filename):
+    """ Save all arrays into a .npz file
+    """
+    np.savez(filename,
+        shape=np.array([self.height, self.width, self.max_ply,
+                        self.opening_plies]),
+        moves=self.moves, occupancy=self.occupancy, reached=self.reached,
+        lengths=self.lengths, outcomes=self.outcomes,
+        opening_keys=self.opening_keys, opening_counts=self.opening_counts)
+
+  @classmethod
+  def load(cls, filename):
+    """ Load statistics saved by `save`
+    """
+    z = np.load(filename)
+    h, w, mp, k = map(int, z['shape'])
+    s = cls(h, w, max_ply=mp, opening_plies=k)
+    for name in ('moves', 'occupancy', 'reached', 'lengths', 'outcomes',
+                 'opening_keys', 'opening_counts'):
+      setattr(s, name, z[name])
+    return s
+
+  def to_csv(self, directory):
+    """ Write statistics as CSV files
+
+    Files:
+      moves.csv, occupancy.csv: ply, reached, then a column per cell 'rc'
+      lengths.csv: length, games
+      openings.csv: moves (e.g. '77 78 66'), games, draws, black_wins,
+        white_wins, black_win_rate
+    """
+    os.makedirs(directory, exist_ok=True)
+    def cell(i):
+      return _int_to_digit(i // self.width) + _int_to_digit(i % self.width)
+    sz = self.height * self.width
+    head = "ply,reached," + ",".join(cell(i) for i in range(sz))
+    for name in ('moves', 'occupancy'):
+      a = np.concatenate([np.arange(self.max_ply)[:, None],
+          self.reached[:, None], getattr(self, name)], axis=1)
+      np.savetxt(os.path.join(directory, name + ".csv"), a, fmt="%d",
+                 delimiter=",", header=head, comments="")
+    a = np.stack([np.arange(sz + 1), self.lengths], axis=1)
+    np.savetxt(os.path.join(directory, "lengths.csv"), a, fmt="%d",
+               delimiter=",", header="length,games", comments="")
+    moves, c, rate = self.opening_table()
+    with open(os.path.join(directory, "openings.csv"), "w") as f:
+      f.write("moves,games,draws,black_wins,white_wins,black_win_rate\n")
+      for m, cc, r in zip(moves, c, rate):
+        s = " ".join(cell(i) for i in m if i < sz)
+        f.write("{},{},{},{},{},{:.6f}\n".format(
+            s, cc.sum(), cc[0], cc[1], cc[2], r))
+
+def _stats_shard(task):
+  filename, heads, height, width, max_ply, opening_plies, chunk = task
+  s = CorpusStats(height, width, max_ply, opening_plies)
+  pairs = record.open_record(filename)
+  for i in range(0, len(heads), chunk):
+    s.add_games(pairs, heads[i : i + chunk])
+  return s
+
+def corpus_stats(filenames, height, width, max_ply=None, opening_plies=3,
+    processes=None, chunk_games=4096):
+  """ Collect statistics of record files
+
+  Args:
+    filenames (str[]): gen2 record files
+    height (int): Height of board
+    width (int): Width of board
+    max_ply (int?): Plies tracked by heatmaps. Default is height * width.
+    opening_plies (int): Number of moves in an opening
+    processes (int?): Number of worker processes. Default is cpu count.
+      1 runs everything in this process.
+    chunk_games (int): Games decoded at once by a worker
+
+  Returns:
+    CorpusStats
+
+  Raises:
+    ValueError: A record is corrupted (see `mock5.validate`)
+  """
+  res = CorpusStats(height, width, max_ply, opening_plies)
+  for s in record.map_shards(
+      _stats_shard, filenames, height, width,
+      (height, width, max_ply, opening_plies, chunk_games),
+      processes=processes, ordered=False):
+    res.merge(s)
+  return res
+
+if __name__ == "__main__":
+  import sys
+  if len(sys.argv) < 5:
+    print("Usage: {} <OUT_DIR> <HEIGHT> <WIDTH> <RECORD>...".format(sys.argv[0]))
+    sys.exit(1)
+  s = corpus_stats(sys.argv[4:], int(sys.argv[2]), int(sys.argv[3]))
+  s.to_csv(sys.argv[1])
+  print("{} games".format(s.n_games))
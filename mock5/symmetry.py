@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""mock5 symmetry
+
+Author: lumiknit (aasr4r4@gmail.com)
+
+D4-group (rotation/flip) permutation tables for Mock5 boards.
+
+A symmetry index k is `flip * 4 + angle`, the same meaning as
+`Mock5.replay(angle, flip)`: the board is flipped left-right if flip is 1,
+and then rotated 90 * angle degrees counter-clockwise.
+Odd angles swap height and width, thus non-square boards keep their shape
+only with k in (0, 2, 4, 6).
+
+Tables are plain tuples (cached per board size), and `numpy` is imported
+only by the batch helpers at the bottom.
+"""
+
+from functools import lru_cache
+
+N_SYMMETRIES = 8
+
+# Base-3 digits packed in one uint64 word (3 ** 40 < 2 ** 64)
+CELLS_PER_WORD = 40
+
+#-- Tables
+
+def symmetry_shape(height, width, k):
+  """ (height, width) of a board after k-th symmetry
+  """
+  if k % 2 == 1: return (width, height)
+  return (height, width)
+
+def symmetries(height, width):
+  """ Symmetry indices which keep the shape of board
+
+  Returns:
+    tuple(int): All 8 indices for square board, otherwise (0, 2, 4, 6)
+  """
+  if height == width: return tuple(range(N_SYMMETRIES))
+  return (0, 2, 4, 6)
+
+def inverse_symmetry(k):
+  """ Index of the inverse of k-th symmetry
+
+  Flipped ones are involutions, and rotations are inverted by the opposite
+  angle.
+  """
+  if k >= 4: return k
+  return (4 - k) % 4
+
+@lru_cache(maxsize=None)
+def forward_table(height, width, k):
+  """ Where each cell moves
+
+  Returns:
+    tuple(int): f such that the stone at idx is moved to f[idx]
+      in the transformed board. Use it to transform histories.
+  """
+  mh, mw = height - 1, width - 1
+  angle, flip = k % 4, k // 4
+  f = []
+  for idx in range(height * width):
+    r, c = idx // width, idx % width
+    if flip == 1: c = mw - c
+    if angle == 0: f.append(r * width + c)
+    elif angle == 1: f.append((mw - c) * height + r)
+    elif angle == 2: f.append((mh - r) * width + (mw - c))
+    else: f.append(c * height + (mh - r))
+  return tuple(f)
+
+@lru_cache(maxsize=None)
+def gather_table(height, width, k):
+  """ Where each cell comes from
+
+  Returns:
+    tuple(int): g such that new_board[j] = board[g[j]].
+      Use it to transform boards.
+  """
+  f = forward_table(height, width, k)
+  g = [0] * len(f)
+  for i, j in enumerate(f): g[j] = i
+  return tuple(g)
+
+#-- Batch helpers (numpy)
+
+@lru_cache(maxsize=None)
+def gather_array(height, width):
+  """ Gather tables of shape-preserving symmetries as numpy array
+
+  Returns:
+    numpy.array(intp)[len(symmetries(height, width))][height * width]:
+      Read-only. Row s is `gather_table(height, width, symmetries(..)[s])`
+  """
+  import numpy as np
+  a = np.array([gather_table(height, width, k)
+                for k in symmetries(height, width)], dtype=np.intp)
+  a.flags.writeable = False
+  return a
+
+@lru_cache(maxsize=None)
+def forward_array(height, width):
+  """ Forward tables of shape-preserving symmetries as numpy array
+
+  See `gather_array`.
+  """
+  import numpy as np
+  a = np.array([forward_table(height, width, k)
+                for k in symmetries(height, width)], dtype=np.intp)
+  a.flags.writeable = False
+  return a
+
+def pack_boards(boards):
+  """ Pack boards of 0, 1, 2 into base-3 uint64 words
+
+  The most significant digit comes first, so comparing words in order is
+  the same as comparing boards lexicographically.
+
+  Args:
+    boards (numpy.array[..., n]): Boards filled with 0, 1 or 2
+
+  Returns:
+    numpy.array(uint64)[..., ceil(n / CELLS_PER_WORD)]
+  """
+  import numpy as np
+  boards = np.asarray(boards)
+  n = boards.shape[-1]
+  k = -(-n // CELLS_PER_WORD)
+  out = np.zeros(boards.shape[:-1] + (k,), dtype=np.uint64)
+  three = np.uint64(3)
+  # Horner's rule over cell columns, not to widen the whole boards
+  for j in range(k):
+    acc = out[..., j]
+    for i in range(j * CELLS_PER_WORD, (j + 1) * CELLS_PER_WORD):
+      acc *= three
+      if i < n: acc += boards[..., i]
+  return out
+
+def unpack_boards(words, n):
+  """ Inverse of `pack_boards`
+
+  Args:
+    words (numpy.array(uint64)[..., k]): Packed boards
+    n (int): Number of cells (height * width)
+
+  Returns:
+    numpy.array(uint8)[..., n]
+  """
+  import numpy as np
+  words = np.asarray(words, dtype=np.uint64)
+  w = np.power(np.uint64(3), np.arange(CELLS_PER_WORD - 1, -1, -1,
+                                       dtype=np.uint64))
+  d = (words[..., None] // w) % np.uint64(3)
+  d = d.reshape(words.shape[:-1] + (-1,))
+  return d[..., :n].astype(np.uint8)
+
+def lexmin(variants):
+  """ Find lexicographically minimal rows among variants
+
+  Args:
+    variants (numpy.array[s][N][k]): s candidates for each of N rows
+
+  Returns:
+    numpy.array(intp)[N]: Index of the minimal candidate (the smallest index
+      on ties)
+  """
+  import numpy as np
+  s, n, _ = variants.shape
+  best = np.zeros(n, dtype=np.intp)
+  cur = variants[0]
+  rows = np.arange(n)
+  for i in range(1, s):
+    v = variants[i]
+    diff = v != cur
+    first = diff.argmax(axis=1)
+    less = diff.any(axis=1) & (v[rows, first] < cur[rows, first])
+    best[less] = i
+    cur = np.where(less[:, None], v, cur)
+  return best
+
+def hash_words(words):
+  """ 64-bit hash of packed words
+
+  Args:
+    words (numpy.array(uint64)[N][k])
+
+  Returns:
+    numpy.array(uint64)[N]
+  """
+  import numpy as np
+  words = np.asarray(words, dtype=np.uint64)
+  h = np.full(words.shape[0], 0x9E3779B97F4A7C15, dtype=np.uint64)
+  with np.errstate(over='ignore'):
+    for i in range(words.shape[1]):
+      h ^= words[:, i]
+      h ^= h >> np.uint64(30)
+      h *= np.uint64(0xBF58476D1CE4E5B9)
+      h ^= h >> np.uint64(27)
+      h *= np.uint64(0x94D049BB133111EB)
+      h ^= h >> np.uint64(31)
+  return h
+
+def canonical_words(boards, height, width):
+  """ Canonicalize boards to the minimal D4 representative
+
+  Args:
+    boards (numpy.array[N][height * width]): Boards filled with 0, 1 or 2
+
+  Returns:
+    numpy.array(uint64)[N][k]: Packed minimal representatives
+    numpy.array(uint8)[N]: Symmetry index k which maps board to it
+  """
+  import numpy as np
+  boards = np.asarray(boards)
+  g = gather_array(height, width)
+  variants = pack_boards(boards[:, g]).transpose(1, 0, 2)
+  best = lexmin(variants)
+  sym = np.array(symmetries(height, width), dtype=np.uint8)[best]
+  return variants[best, np.arange(len(best))], sym
@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""mock5 validate
+
+Author: lumiknit (aasr4r4@gmail.com)
+
+Bulk validator for gen2 records (see `mock5.record`).
+
+Each game is checked for:
+  * corrupt: the header does not fit the file (truncated record,
+    negative length or length larger than the board), or winner is not
+    one of 0, 1, 2. The rest of a file after a broken header is skipped.
+  * illegal: a move is out of board, on an occupied cell,
+    or placed after the game was already won
+  * mislabelled: the recorded winner differs from the replayed result
+    (1 or 2 for the player who made 5-in-a-row by the last move,
+    0 for a full board without 5-in-a-row)
+
+Games are not replayed one by one. Instead, each chunk of games is
+scattered into boards of move numbers, and for every line of 5 cells the
+move completing it is the maximum move number among them. Thus the whole
+check is a few numpy operations per chunk, and shards run over processes.
+
+Example:
+  python -m mock5.validate 15 15 out1 out2
+"""
+
+from collections import namedtuple
+import numpy as np
+
+from mock5 import record
+
+Problem = namedtuple('Problem', 'filename offset kind message')
+Problem.__doc__ = """ A problem found in a record
+
+  Attributes:
+    filename (str): Record file
+    offset (int): Byte offset of the game header
+    kind (str): 'corrupt', 'illegal' or 'mislabelled'
+    message (str): Human readable details
+"""
+
+_NEVER = np.iinfo(np.int32).max
+
+def _line_windows(height, width):
+  """ Slices of 5 cells in a row for each direction
+
+  Returns:
+    list(list((slice, slice))): For each direction, 5 (row, col) slices of
+      a (height, width) board; k-th slice picks the k-th cell of all lines.
+  """
+  ws = []
+  if width >= 5:
+    ws.append([(slice(0, height), slice(t, width - 4 + t))
+               for t in range(5)])
+  if height >= 5:
+    ws.append([(slice(t, height - 4 + t), slice(0, width))
+               for t in range(5)])
+  if height >= 5 and width >= 5:
+    ws.append([(slice(t, height - 4 + t), slice(t, width - 4 + t))
+               for t in range(5)])
+    ws.append([(slice(t, height - 4 + t), slice(4 - t, width - t))
+               for t in range(5)])
+  return ws
+
+def first_win_ply(plies, colors):
+  """ Ply at which the first 5-in-a-row is completed
+
+  Args:
+    plies (numpy.array(int32)[G][height][width]):
+      Ply of the stone on each cell. Empty cells should be large enough.
+    colors (numpy.array(uint8)[G][height][width]):
+      Board filled with 0, 1, 2
+
+  Returns:
+    numpy.array(int32)[G]: First winning ply, or the max int32 if none
+  """
+  g, h, w = plies.shape
+  best = np.full(g, _NEVER, dtype=np.int32)
+  for win in _line_windows(h, w):
+    c0 = colors[(slice(None),) + win[0]]
+    same = c0 > 0
+    done = plies[(slice(None),) + win[0]]
+    for s in win[1:]:
+      same &= colors[(slice(None),) + s] == c0
+      done = np.maximum(done, plies[(slice(None),) + s])
+    done = np.where(same, done, _NEVER).reshape(g, -1)
+    best = np.minimum(best, done.min(axis=1, initial=_NEVER))
+  return best
+
+def validate_games(pairs, heads, height, width):
+  """ Validate complete games of a record
+
+  Args:
+    pairs (numpy.array[n][2]): Int pairs (see `record.open_record`)
+    heads (numpy.array(int64)[G]): Header indices (see `record.scan_games`)
+    height (int): Height of board
+    width (int): Width of board
+
+  Returns:
+    list((int, str, str)): (header index, kind, message) of bad games
+  """
+  sz = height * width
+  heads = np.asarray(heads, dtype=np.int64)
+  g = len(heads)
+  winners = pairs[heads, 0].astype(np.int64)
+  lengths = pairs[heads, 1].astype(np.int64)
+  kind = np.zeros(g, dtype=np.int8) # 0 ok, 1 corrupt, 2 illegal, 3 label
+  detail = np.zeros(g, dtype=np.int64)
+  kind[(lengths < 0) | (lengths > sz) | (winners < 0) | (winners > 2)] = 1
+  # Out of board
+  idx, game, ply = record.game_moves(pairs, heads)
+  out = (idx < 0) | (idx >= sz)
+  bad = (kind[game] == 0) & out
+  kind[game[bad]] = 2
+  detail[game[bad]] = -1
+  # Scatter moves of sane games
+  ok = kind[game] == 0
+  idx, game, ply = idx[ok], game[ok], ply[ok]
+  plies = np.full((g, sz), _NEVER, dtype=np.int32)
+  colors = np.zeros((g, sz), dtype=np.uint8)
+  plies[game, idx] = ply
+  colors[game, idx] = 1 + (ply % 2)
+  # Occupied cells: fewer distinct cells than moves
+  n_stones = np.count_nonzero(colors, axis=1)
+  dup = (kind == 0) & (n_stones < lengths)
+  kind[dup] = 2
+  detail[dup] = -2
+  # Win
+  win = first_win_ply(plies.reshape(g, height, width),
+                      colors.reshape(g, height, width))
+  late = (kind == 0) & (win < lengths - 1)
+  kind[late] = 2
+  detail[late] = win[late]
+  result = np.where(win == lengths - 1, 1 + (lengths - 1) % 2,
+                    np.where(lengths == sz, 0, -1))
+  label = (kind == 0) & (result != winners)
+  kind[label] = 3
+  detail[label] = result[label]
+  problems = []
+  for i in np.flatnonzero(kind):
+    k, d = kind[i], detail[i]
+    if k == 1:
+      msg = "winner {}, length {}".format(winners[i], lengths[i])
+      problems.append((int(heads[i]), 'corrupt', msg))
+    elif k == 2:
+      if d == -1: msg = "move out of board"
+      elif d == -2: msg = "move on an occupied cell"
+      else: msg = "moves after the game was won at ply {}".format(d)
+      problems.append((int(heads[i]), 'illegal', msg))
+    else:
+      if d < 0: msg = "recorded winner {}, but not finished".format(winners[i])
+      else: msg = "recorded winner {}, replayed {}".format(winners[i], d)
+      problems.append((int(heads[i]), 'mislabelled', msg))
+  return problems
+
+def _validate_shard(task):
+  filename, heads, height, width, chunk = task
+  pairs = record.open_record(filename)
+  problems = []
+  for s in range(0, len(heads), chunk):
+    for p, kind, msg in validate_games(
+        pairs, heads[s : s + chunk], height, width):
+      problems.append(Problem(filename, p * 8, kind, msg))
+  n_moves = int(pairs[heads, 1].sum()) if len(heads) else 0
+  return problems, len(heads), n_moves
+
+def validate_records(filenames, height, width, processes=None,
+    chunk_games=4096):
+  """ Validate record files
+
+  Args:
+    filenames (str[]): gen2 record files
+    height (int): Height of board
+    width (int): Width of board
+    processes (int?): Number of worker processes. Default is cpu count.
+      1 runs everything in this process.
+    chunk_games (int): Games validated at once by a worker
+
+  Returns:
+    list(Problem): Problems sorted by file and offset
+    int: Number of games
+    int: Number of moves
+  """
+  problems = []
+  def on_corrupt(filename, p, msg):
+    problems.append(Problem(filename, p * 8, 'corrupt', msg))
+  n_games, n_moves = 0, 0
+  for ps, g, m in record.map_shards(
+      _validate_shard, filenames, height, width, (height, width, chunk_games),
+      processes=processes, on_corrupt=on_corrupt):
+    problems.extend(ps)
+    n_games += g
+    n_moves += m
+  problems.sort(key=lambda p: (filenames.index(p.filename), p.offset))
+  return problems, n_games, n_moves
+
+if __name__ == "__main__":
+  import sys
+  import time
+  if len(sys.argv) < 4:
+    print("Usage: {} <HEIGHT> <WIDTH> <RECORD>...".format(sys.argv[0]))
+    sys.exit(1)
+  t = time.time()
+  problems, n_games, n_moves = validate_records(
+      sys.argv[3:], int(sys.argv[1]), int(sys.argv[2]))
+  t = time.time() - t
+  for p in problems:
+    print("{}:{}: {}: {}".format(p.filename, p.offset, p.kind, p.message))
+  print("{} games, {} moves, {} problems in {:.2f}s ({:.0f} moves/s)"
+        .format(n_games, n_moves, len(problems), t, n_moves / max(t, 1e-9)))
+  sys.exit(1 if problems else 0)
@@ -33,7 +33,7 @@ if __name__ == "__main__":
   if l <= 1:
     Mock5().play()
   elif l == 2:
-    Mock5().play(agents[sys.argv[1]])
+    Mock5().play(agents[sys.argv[1]], ponder=True)
   elif l == 3:
     h = int(sys.argv[1])
     w = int(sys.argv[2])
@@ -41,7 +41,7 @@ if __name__ == "__main__":
   elif l == 4:
     h = int(sys.argv[2])
     w = int(sys.argv[3])
-    Mock5(h, w).play(agents[sys.argv[1]])
+    Mock5(h, w).play(agents[sys.argv[1]], ponder=True)
   elif l == 5:
     h = int(sys.argv[3])
     w = int(sys.argv[4])